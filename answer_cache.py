@@ -0,0 +1,113 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# --- Configuration ---
+CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Cosine similarity above which a new query reuses a cached answer
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+
+def normalize_query(query):
+    """Lowercases, trims punctuation and collapses whitespace so trivial variants share a key."""
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.strip(" ?!.,")
+
+
+class AnswerCache:
+    """
+    Bounded LRU + TTL cache of final answers with two lookup tiers:
+    an exact match on the normalized query text, and a semantic match on
+    the query embedding within the same product category. A hit returns
+    {"answer", "product_category", "matches"}: the product and the chunks the
+    answer was built from, so a conversation can continue from it.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS,
+                 similarity_threshold=CACHE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # normalized query -> entry dict
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _is_expired(self, entry, now):
+        return now - entry["created_at"] > self.ttl_seconds
+
+    def _hit(self, entry):
+        return {"answer": entry["answer"], "product_category": entry["product_category"],
+                "matches": list(entry["matches"])}
+
+    def get(self, query):
+        """Returns the cached hit for the exact (normalized) query, or None."""
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, now):
+                del self._entries[key]
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return self._hit(entry)
+
+    def get_similar(self, query_vector, product_category):
+        """
+        Returns the hit for the most similar cached query in the same product
+        category if it clears the similarity threshold, otherwise None.
+        Counts a miss, since this is the last tier checked before generation.
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        now = time.monotonic()
+        with self._lock:
+            keys = [k for k, e in self._entries.items()
+                    if e["product_category"] == product_category and not self._is_expired(e, now)]
+            if keys:
+                scores = np.vstack([self._entries[k]["vector"] for k in keys]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.counters["semantic_hits"] += 1
+                    return self._hit(self._entries[keys[best]])
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, query, answer, query_vector, product_category, matches=None):
+        """
+        Stores an answer with its product and the chunks it was built from,
+        evicting the least recently used entry when full.
+        """
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "vector": vector,
+                "product_category": product_category,
+                "matches": list(matches or []),
+                "created_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        """Returns hit/miss/eviction counters plus the current size for sizing the cache."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self._entries)
+        stats["max_entries"] = self.max_entries
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
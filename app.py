@@ -1,108 +1,44 @@
-import os
-from flask import Flask, render_template, request, jsonify
-from dotenv import load_dotenv
-import pinecone
-import google.generativeai as genai
-# --- MODIFICATION: Import the specific exception for rate limiting ---
-from google.api_core import exceptions as google_exceptions
-from sentence_transformers import SentenceTransformer
+import json
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+import services
+import metrics
+from rag_pipeline import parse_batch_queries, batch_result_line
+from session_store import session_id_from
 
 # --- 1. INITIALIZATION ---
-
-# Load environment variables from .env file
-load_dotenv()
-print("Initializing connections and loading models...")
+# Models and clients live in services.py and are created lazily, so importing
+# this module is fast and starts nothing. The server starts loading them (and
+# warming up the embedding model) on a background thread: gunicorn's post_fork
+# hook, `python app.py`, or otherwise the first request. /ready reports when
+# that's done.
 
 # Initialize Flask App
 app = Flask(__name__)
 
-# Initialize Pinecone
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-if not PINECONE_API_KEY:
-    raise ValueError("PINECONE_API_KEY not found in .env file")
-
-pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
-index_host = "https://microwave-support-lhzdo1l.svc.aped-4627-b74a.pinecone.io"
-index = pc.Index(host=index_host)
 
-# Initialize Google Gemini
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY not found in .env file")
-genai.configure(api_key=GOOGLE_API_KEY)
-gemini_model = genai.GenerativeModel('gemini-1.5-flash')
+# --- 2. THE CORE RAG PIPELINE (see rag_pipeline.py) ---
 
-# Initialize the Embedding Model (this can take a moment)
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+def get_answer(query, session_id=None):
+    return services.get_pipeline().get_answer(query, session_id)
 
-print("✅ System is ready.")
+def stream_answer(query, session_id=None):
+    return services.get_pipeline().stream_answer(query, session_id)
 
-# --- 2. THE CORE RAG FUNCTION (from your script) ---
 
-def get_answer(query):
-    """
-    The main logic for the RAG system.
-    """
-    # --- Step 1: Classify the product category ---
-    classification_prompt = f"""
-    Based on the user's question, identify which of the following product categories it belongs to:
-    microwave, washing_machine, fridge.
-    Return only the single category name and nothing else.
-    Question: "{query}"
-    Category:
-    """
-    # --- MODIFICATION: Improved error handling for the API call ---
-    try:
-        classification_response = gemini_model.generate_content(classification_prompt)
-        product_category = classification_response.text.strip().lower()
-        if product_category not in ["microwave", "washing_machine", "fridge"]:
-            return "I can only answer questions about microwaves, washing machines, or fridges. Please be more specific."
-    
-    except google_exceptions.ResourceExhausted as e:
-        print(f"RATE LIMIT ERROR: {e}")
-        return "Sorry, I've hit my daily usage limit for the API. Please try again tomorrow or upgrade to a paid plan."
-        
-    except Exception as e:
-        print(f"Error in classification: {e}")
-        return "I had trouble understanding which product you're asking about. Please rephrase."
-
-    print(f"--> Detected product: {product_category}")
-
-    # --- Step 2: Create a query vector ---
-    query_vector = embedding_model.encode(query).tolist()
-
-    # --- Step 3: Search Pinecone with a metadata filter ---
-    search_results = index.query(
-        vector=query_vector,
-        top_k=5,
-        include_metadata=True,
-        filter={"product_type": product_category}
-    )
-
-    # --- Step 4: Build the context ---
-    context = ""
-    if search_results['matches']:
-        for match in search_results['matches']:
-            context += match['metadata']['text'] + "\n---\n"
-    else:
-        return f"I couldn't find any specific information about that in my {product_category} documents."
-
-    # --- Step 5: Generate the final answer ---
-    prompt = f"""
-    You are a helpful AI assistant for troubleshooting {product_category} issues.
-    Answer the user's question based ONLY on the following context.
-    If the context doesn't contain enough information, say "I don't have enough information in my documents to answer that."
-    CONTEXT:
-    {context}
-    USER'S QUESTION:
-    {query}
-    ANSWER:
-    """
-    final_response = gemini_model.generate_content(prompt)
-    return final_response.text
+# --- 3. FLASK ROUTES ---
 
+@app.before_request
+def start_timing():
+    services.start_background_warmup()  # no-op once started
+    metrics.start_request(request.headers.get("X-Request-ID"))
 
-# --- 3. FLASK ROUTES ---
+@app.after_request
+def finish_timing(response):
+    response.headers["X-Request-ID"] = metrics.current_request_id()
+    # A streamed answer is still being generated here; its generator finishes the timing
+    if response.mimetype not in ('text/event-stream', 'application/x-ndjson'):
+        metrics.finish_request(metrics.endpoint_label(request.url_rule))
+    return response
 
 @app.route('/')
 def home():
@@ -118,13 +54,112 @@ def ask():
     if not user_query:
         return jsonify({"error": "No query provided."}), 400
 
+    # Follow-up questions send back the session_id from the previous answer
+    session_id = session_id_from(data.get('session_id'))
     print(f"Received query: {user_query}")
-    answer = get_answer(user_query)
+    answer = get_answer(user_query, session_id)
     
     # Return the answer as a JSON object
-    return jsonify({"answer": answer})
+    return jsonify({"answer": answer, "session_id": session_id})
+
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    """Streams the answer as server-sent events: one "token" event per piece, then "done"."""
+    data = request.get_json()
+    user_query = data.get('query')
+
+    if not user_query:
+        return jsonify({"error": "No query provided."}), 400
+
+    # The session id goes back in the X-Session-ID header, before the answer starts
+    session_id = session_id_from(data.get('session_id'))
+    print(f"Received streaming query: {user_query}")
+
+    def events():
+        try:
+            for text in stream_answer(user_query, session_id):
+                yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+        except Exception as e:
+            print(f"Error while streaming answer: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Sorry, something went wrong. Please try again.'})}\n\n"
+            return
+        finally:
+            metrics.finish_request('/ask/stream')
+        yield "event: done\ndata: {}\n\n"
+
+    # X-Accel-Buffering stops reverse proxies from holding the stream back
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Session-ID': session_id})
+
+@app.route('/ask/batch', methods=['POST'])
+def ask_batch():
+    """
+    Answers a JSONL body of {"query": ...} lines (optionally with "id") and
+    streams back one JSON line per answer, in completion order, with timings.
+    """
+    try:
+        items = parse_batch_queries(request.get_data(as_text=True).splitlines())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not items:
+        return jsonify({"error": "No queries provided."}), 400
+
+    print(f"Received batch of {len(items)} queries")
+
+    def lines():
+        try:
+            for result in services.get_pipeline().answer_batch([item["query"] for item in items]):
+                yield batch_result_line(items, result)
+        finally:
+            metrics.finish_request('/ask/batch')
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+@app.route('/retrieval/stats')
+def retrieval_stats():
+    """Reports per-stage latency of hybrid retrieval (vector, keyword, fusion, rerank)."""
+    retriever = services.get_retriever()
+    return jsonify(retriever.stats() if retriever else {"hybrid_retrieval": False})
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once models are loaded and warm, 503 until then."""
+    is_ready, details = services.readiness()
+    return jsonify(details), (200 if is_ready else 503)
+
+@app.route('/classifier/stats')
+def classifier_stats():
+    """Reports how often product classification fell back to the LLM."""
+    return jsonify(services.get_product_classifier().stats())
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Reports answer cache hits, misses and evictions."""
+    return jsonify(services.get_answer_cache().stats())
+
+@app.route('/faq/stats')
+def faq_stats():
+    """Reports how often the FAQ index answered without the LLM, and its lookup latency."""
+    faq_index = services.get_faq_index()
+    return jsonify(faq_index.stats() if faq_index else {"faq_fast_path": False})
+
+@app.route('/sessions/stats')
+def session_stats():
+    """Reports live conversation sessions and their estimated memory use."""
+    return jsonify(services.get_session_store().stats())
+
+@app.route('/embedder/stats')
+def embedder_stats():
+    """Reports embedding batch sizes and queueing delay."""
+    return jsonify(services.get_embedding_model().stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Latency histograms and counters in the Prometheus text format."""
+    return Response(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
 
 # --- 4. RUN THE APP ---
 if __name__ == '__main__':
+    services.start_background_warmup()
     # The host='0.0.0.0' makes it accessible on your local network
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -1,116 +1,92 @@
 import os
-import pinecone
-import google.generativeai as genai
-from sentence_transformers import SentenceTransformer
+import sys
+import time
+import argparse
+import contextlib
 from getpass import getpass
+import services
+from local_index import RETRIEVER_BACKEND
+from product_registry import product_list_text
+from rag_pipeline import BATCH_GENERATION_WORKERS, parse_batch_queries, batch_result_line
 
 # --- 1. Initialize Connections ---
-print("Initializing connections...")
+# The models and clients are the same ones app.py uses (see services.py);
+# here we only ask for any API keys that aren't in the environment.
+# (stderr, so `--batch` output on stdout stays pure JSONL)
+print("Initializing connections...", file=sys.stderr)
 
-# Initialize Pinecone
-PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY") or getpass("Enter your Pinecone API Key: ")
-# This host URL is for your specific index.
-index_host = "https://microwave-support-lhzdo1l.svc.aped-4627-b74a.pinecone.io" 
+if RETRIEVER_BACKEND != "local" and not os.environ.get("PINECONE_API_KEY"):
+    os.environ["PINECONE_API_KEY"] = getpass("Enter your Pinecone API Key: ")
+if not os.environ.get("GOOGLE_API_KEY"):
+    os.environ["GOOGLE_API_KEY"] = getpass("Enter your Google AI API Key: ")
 
-pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(host=index_host)
 
-# Initialize Google Gemini
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY") or getpass("Enter your Google AI API Key: ")
-genai.configure(api_key=GOOGLE_API_KEY)
-gemini_model = genai.GenerativeModel('gemini-1.5-flash')
-
-# Initialize the Embedding Model
-print("Loading embedding model...")
-# This model creates the vectors for searching.
-model = SentenceTransformer('all-MiniLM-L6-v2')
-print("Model loaded. System is ready.")
-
-
-# --- 2. Define the Upgraded RAG Function ---
+# --- 2. The RAG Function (shared with app.py, see rag_pipeline.py) ---
 
 def get_answer(query):
     """
-    Takes a user query, classifies the product, retrieves filtered context 
-    from Pinecone, and generates an answer using Google Gemini.
-    """
-    
-    # --- NEW: Step 1 - Classify the product category ---
-    classification_prompt = f"""
-    Based on the user's question, identify which of the following product categories it belongs to: 
-    microwave, washing_machine, fridge.
-    Return only the single category name and nothing else.
-
-    Question: "{query}"
-    Category:
+    Takes a user query, classifies the product, retrieves filtered context
+    and generates an answer using Google Gemini.
     """
-    try:
-        classification_response = gemini_model.generate_content(classification_prompt)
-        product_category = classification_response.text.strip().lower()
-        
-        # A quick check to ensure the response is a valid category
-        if product_category not in ["microwave", "washing_machine", "fridge"]:
-             return "I'm sorry, I can only answer questions about microwaves, washing machines, or fridges. Please clarify which product you're asking about."
-
-    except Exception as e:
-        print(f"Error during classification: {e}")
-        return "I had trouble understanding which product you're asking about. Please try rephrasing your question."
-
-    print(f"--> Detected product: {product_category}")
-    
-    # --- Step 2: Create a query vector ---
-    query_vector = model.encode(query).tolist()
+    return services.get_pipeline().get_answer(query)
 
-    # --- Step 3: Search Pinecone with a metadata filter ---
-    print("Searching for relevant documents...")
-    search_results = index.query(
-        vector=query_vector,
-        top_k=5,
-        include_metadata=True,
-        # THIS IS THE KEY: Filter the search by the detected product type
-        filter={"product_type": product_category}
-    )
 
-    # --- Step 4: Build the context ---
-    context = ""
-    if search_results['matches']:
-        for match in search_results['matches']:
-            context += match['metadata']['text'] + "\n---\n"
-    else:
-        # Handle case where no documents were found for that filter
-        return f"I'm sorry, I couldn't find any specific information about that in my {product_category} documents."
-    
-    # --- Step 5: Generate the final answer ---
-    # The prompt is now dynamic and changes based on the detected product
-    prompt = f"""
-    You are a helpful AI assistant for troubleshooting {product_category} issues.
-    Answer the user's question based ONLY on the following context.
-    If the context doesn't contain enough information to answer, say "I'm sorry, I don't have enough information in my documents to answer that question."
-
-    CONTEXT:
-    {context}
-
-    USER'S QUESTION:
-    {query}
-
-    ANSWER:
+def run_batch(input_path, output_path, workers):
+    """
+    Answers every query in a JSONL file (see rag_pipeline.parse_batch_queries)
+    and writes one JSON line per answer, in completion order, to output_path
+    (or stdout). Progress and the pipeline's logging go to stderr.
     """
-    
-    print("Generating answer...")
-    final_response = gemini_model.generate_content(prompt)
-    
-    return final_response.text
+    with open(input_path, "r", encoding="utf-8") as f:
+        items = parse_batch_queries(f)
+    print(f"Answering {len(items)} queries with up to {workers} parallel generations...", file=sys.stderr)
+
+    start = time.perf_counter()
+    output = open(output_path, "w", encoding="utf-8") if output_path else sys.stdout
+    errors = 0
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            for done, result in enumerate(services.get_pipeline().answer_batch(
+                    [item["query"] for item in items], max_workers=workers), start=1):
+                output.write(batch_result_line(items, result))
+                output.flush()
+                errors += "error" in result
+                print(f"[{done}/{len(items)}] {result['elapsed_ms']:.0f}ms", file=sys.stderr)
+    finally:
+        if output_path:
+            output.close()
+    seconds = time.perf_counter() - start
+    print(f"Done: {len(items)} answers ({errors} errors) in {seconds:.1f}s, "
+          f"{len(items) / seconds:.2f} queries/s.", file=sys.stderr)
 
 
 # --- 3. Run the Chatbot ---
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Samsung product support bot.")
+    parser.add_argument("--batch", metavar="QUERIES.jsonl",
+                        help="Answer a JSONL file of queries instead of starting the chat.")
+    parser.add_argument("--output", metavar="RESULTS.jsonl", help="Where to write batch results (default stdout).")
+    parser.add_argument("--workers", type=int, default=BATCH_GENERATION_WORKERS,
+                        help="Parallel generation calls in batch mode.")
+    args = parser.parse_args()
+
+    if args.batch:
+        with contextlib.redirect_stdout(sys.stderr):
+            services.warm_up()
+        run_batch(args.batch, args.output, args.workers)
+        sys.exit(0)
+
+    print("Loading embedding model...")
+    services.warm_up()
+    print("Model loaded. System is ready.")
+
     print("\nWelcome to the Samsung Product Support Bot! Type 'exit' to quit.")
     while True:
-        user_query = input("\nPlease ask your question about a microwave, fridge, or washing machine: ")
+        user_query = input(f"\nPlease ask your question about {product_list_text()}: ")
         if user_query.lower() == 'exit':
             break
-        
+
         answer = get_answer(user_query)
         print("\nANSWER:")
-        print(answer)
\ No newline at end of file
+        print(answer)
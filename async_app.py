@@ -0,0 +1,169 @@
+import json
+import asyncio
+import threading
+from quart import Quart, Response, render_template, request, jsonify
+import services
+import metrics
+from rag_pipeline import parse_batch_queries, batch_result_line
+from session_store import session_id_from
+
+# --- 1. INITIALIZATION ---
+# Async (ASGI) version of app.py. All requests share one event loop, so a slow
+# Gemini call no longer pins a worker thread. Run it with, e.g.:
+#   hypercorn async_app:app --bind 0.0.0.0:5000
+
+app = Quart(__name__)
+
+
+@app.before_serving
+async def start_warmup():
+    # Not at import time, so importing this module loads nothing
+    services.start_background_warmup()
+
+
+# --- 2. ROUTES (same API as app.py) ---
+
+@app.before_request
+async def start_timing():
+    metrics.start_request(request.headers.get("X-Request-ID"))
+
+@app.after_request
+async def finish_timing(response):
+    response.headers["X-Request-ID"] = metrics.current_request_id()
+    # A streamed answer is still being generated here; its generator finishes the timing
+    if response.mimetype not in ('text/event-stream', 'application/x-ndjson'):
+        metrics.finish_request(metrics.endpoint_label(request.url_rule))
+    return response
+
+@app.route('/')
+async def home():
+    """Renders the main chat page."""
+    return await render_template('index.html')
+
+@app.route('/ask', methods=['POST'])
+async def ask():
+    """Handles the user's question and returns the AI's answer."""
+    data = await request.get_json()
+    user_query = data.get('query')
+
+    if not user_query:
+        return jsonify({"error": "No query provided."}), 400
+
+    session_id = session_id_from(data.get('session_id'))
+    print(f"Received query: {user_query}")
+    answer = await services.get_async_pipeline().get_answer_async(user_query, session_id)
+    return jsonify({"answer": answer, "session_id": session_id})
+
+@app.route('/ask/stream', methods=['POST'])
+async def ask_stream():
+    """Streams the answer as server-sent events: one "token" event per piece, then "done"."""
+    data = await request.get_json()
+    user_query = data.get('query')
+
+    if not user_query:
+        return jsonify({"error": "No query provided."}), 400
+
+    # The session id goes back in the X-Session-ID header, before the answer starts
+    session_id = session_id_from(data.get('session_id'))
+    print(f"Received streaming query: {user_query}")
+
+    async def events():
+        try:
+            async for text in services.get_async_pipeline().stream_answer_async(user_query, session_id):
+                yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+        except Exception as e:
+            print(f"Error while streaming answer: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Sorry, something went wrong. Please try again.'})}\n\n"
+            return
+        finally:
+            metrics.finish_request('/ask/stream')
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Session-ID': session_id})
+
+@app.route('/ask/batch', methods=['POST'])
+async def ask_batch():
+    """
+    Answers a JSONL body of {"query": ...} lines (optionally with "id") and
+    streams back one JSON line per answer, in completion order, with timings.
+    """
+    try:
+        items = parse_batch_queries((await request.get_data(as_text=True)).splitlines())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not items:
+        return jsonify({"error": "No queries provided."}), 400
+
+    print(f"Received batch of {len(items)} queries")
+
+    # A batch is throughput-bound work, so it runs the sync pipeline's answer_batch
+    # (bulk embedding/retrieval, thread-pooled generation) on its own thread
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+    done = object()
+
+    def produce():
+        try:
+            for result in services.get_pipeline().answer_batch([item["query"] for item in items]):
+                loop.call_soon_threadsafe(results.put_nowait, result)
+        finally:
+            loop.call_soon_threadsafe(results.put_nowait, done)
+
+    async def lines():
+        threading.Thread(target=produce, name="ask-batch", daemon=True).start()
+        try:
+            while (result := await results.get()) is not done:
+                yield batch_result_line(items, result)
+        finally:
+            metrics.finish_request('/ask/batch')
+
+    return Response(lines(), mimetype='application/x-ndjson')
+
+@app.route('/retrieval/stats')
+async def retrieval_stats():
+    """Reports per-stage latency of hybrid retrieval (vector, keyword, fusion, rerank)."""
+    retriever = services.get_retriever()
+    return jsonify(retriever.stats() if retriever else {"hybrid_retrieval": False})
+
+@app.route('/ready')
+async def ready():
+    """Readiness probe: 200 once models are loaded and warm, 503 until then."""
+    is_ready, details = services.readiness()
+    return jsonify(details), (200 if is_ready else 503)
+
+@app.route('/classifier/stats')
+async def classifier_stats():
+    """Reports how often product classification fell back to the LLM."""
+    return jsonify(services.get_product_classifier().stats())
+
+@app.route('/cache/stats')
+async def cache_stats():
+    """Reports answer cache hits, misses and evictions."""
+    return jsonify(services.get_answer_cache().stats())
+
+@app.route('/faq/stats')
+async def faq_stats():
+    """Reports how often the FAQ index answered without the LLM, and its lookup latency."""
+    faq_index = services.get_faq_index()
+    return jsonify(faq_index.stats() if faq_index else {"faq_fast_path": False})
+
+@app.route('/sessions/stats')
+async def session_stats():
+    """Reports live conversation sessions and their estimated memory use."""
+    return jsonify(services.get_session_store().stats())
+
+@app.route('/embedder/stats')
+async def embedder_stats():
+    """Reports embedding batch sizes and queueing delay."""
+    return jsonify(services.get_embedding_model().stats())
+
+@app.route('/metrics')
+async def prometheus_metrics():
+    """Latency histograms and counters in the Prometheus text format."""
+    return Response(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# --- 3. RUN THE APP ---
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
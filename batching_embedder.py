@@ -0,0 +1,115 @@
+import os
+import time
+import queue
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+import numpy as np
+
+# --- Configuration ---
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+# How long the first query in a batch waits for others to join it
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+
+class BatchingEmbedder:
+    """
+    Wraps a SentenceTransformer so single-query `encode` calls from concurrent
+    requests are collected for up to a few milliseconds and encoded together
+    in one batched call. A background thread owns the model; callers block on
+    (or await) a Future for their own vector.
+    """
+
+    def __init__(self, model, max_batch_size=EMBED_MAX_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._batch_sizes = Counter()
+        self._queue_delays = deque(maxlen=1000)  # seconds, most recent requests
+        self._start_worker()
+        # Threads don't survive fork (e.g. a prefork server that loaded the
+        # model in its parent), so each child starts its own worker.
+        if hasattr(os, "register_at_fork"):  # not on Windows, which has no fork
+            os.register_at_fork(after_in_child=self._start_worker)
+
+    def _start_worker(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="batching-embedder", daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        """Queues one query for embedding and returns a Future for its vector."""
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, sentences, **kwargs):
+        """
+        Same call shape as SentenceTransformer.encode. A single string goes
+        through the batching queue; lists are already batched and go straight
+        to the model.
+        """
+        if isinstance(sentences, str) and not kwargs:
+            return self.submit(sentences).result()
+        return self.model.encode(sentences, **kwargs)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Callers that gave up (e.g. a cancelled asyncio task) have
+            # cancelled their Future; those queries aren't encoded at all.
+            batch = [item for item in self._collect_batch() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._queue_delays.extend(started - submitted for _, _, submitted in batch)
+
+            try:
+                vectors = self.model.encode([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    self._resolve(future.set_exception, e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                self._resolve(future.set_result, vector)
+
+    @staticmethod
+    def _resolve(setter, value):
+        """Sets one Future's outcome; a failure here must not stop the worker serving everyone else."""
+        try:
+            setter(value)
+        except Exception as e:
+            print(f"Batching embedder: could not deliver a result ({type(e).__name__}: {e})")
+
+    def stats(self):
+        """Returns the batch-size histogram and queueing delay of recent requests."""
+        with self._lock:
+            histogram = dict(sorted(self._batch_sizes.items()))
+            delays = np.array(self._queue_delays) * 1000
+        batches = sum(histogram.values())
+        requests = sum(size * count for size, count in histogram.items())
+        return {
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "batch_size_histogram": histogram,
+            "queue_delay_ms": {
+                "mean": float(delays.mean()) if delays.size else 0.0,
+                "p50": float(np.percentile(delays, 50)) if delays.size else 0.0,
+                "p95": float(np.percentile(delays, 95)) if delays.size else 0.0,
+                "max": float(delays.max()) if delays.size else 0.0,
+            },
+        }
@@ -0,0 +1,78 @@
+import os
+import time
+import argparse
+import numpy as np
+from embedding_backends import load_embedding_model
+from create_embeddings_v2 import MODEL_NAME, split_sources, token_chunker
+from product_registry import PRODUCTS
+
+# Compares the embedding backends on our own chunks: per-query latency,
+# batch throughput, and cosine agreement with the PyTorch vectors.
+#
+#   python benchmark_embedding_backends.py --backends torch onnx onnx-int8
+
+
+def load_chunks(folders, count_tokens, limit):
+    chunks = []
+    for folder in folders:
+        if not os.path.exists(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".txt"):
+                with open(os.path.join(folder, filename), "r", encoding="utf-8") as f:
+                    for _, text in split_sources(f.read(), filename):
+                        chunks.extend(token_chunker(text, count_tokens))
+    return chunks[:limit]
+
+
+def benchmark(model, chunks, queries, batch_size):
+    model.encode(queries[0])  # warm up
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    vectors = np.asarray(model.encode(chunks, batch_size=batch_size), dtype=np.float32)
+    seconds = time.perf_counter() - start
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "chunks_per_s": len(chunks) / seconds,
+        "vectors": vectors / np.linalg.norm(vectors, axis=1, keepdims=True),
+    }
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark torch vs. ONNX embedding backends.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--chunks", type=int, default=500, help="Max chunks for the throughput run.")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    reference_model = load_embedding_model(MODEL_NAME, "torch")
+    count_tokens = lambda t: len(reference_model.tokenizer.tokenize(t))
+    chunks = load_chunks([product["data_folder"] for product in PRODUCTS.values()],
+                         count_tokens, args.chunks)
+    queries = [chunk[:200] for chunk in chunks[:args.queries]]
+    print(f"{len(chunks)} chunks, {len(queries)} single queries, batch size {args.batch_size}\n")
+
+    results = {}
+    for backend in args.backends:
+        model = reference_model if backend == "torch" else load_embedding_model(MODEL_NAME, backend)
+        results[backend] = benchmark(model, chunks, queries, args.batch_size)
+
+    reference = results.get("torch")
+    print(f"{'backend':<12}{'query p50':>11}{'query p95':>11}{'chunks/s':>10}{'cos mean':>10}{'cos min':>9}")
+    for backend, result in results.items():
+        if reference is not None:
+            agreement = (result["vectors"] * reference["vectors"]).sum(axis=1)
+            cosine = f"{agreement.mean():>10.4f}{agreement.min():>9.4f}"
+        else:
+            cosine = f"{'n/a':>10}{'n/a':>9}"
+        print(f"{backend:<12}{result['p50_ms']:>9.2f}ms{result['p95_ms']:>9.2f}ms"
+              f"{result['chunks_per_s']:>10.1f}{cosine}")
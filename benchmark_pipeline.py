@@ -0,0 +1,322 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import contextlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import metrics
+from answer_cache import AnswerCache
+from local_index import LocalIndex
+from product_classifier import ProductClassifier
+from hybrid_retrieval import HYBRID_RETRIEVAL, HybridRetriever, KeywordIndex
+from context_assembler import estimate_tokens
+from llm_client import GeminiClient
+from faq_index import FAQ_SOURCES, FaqIndex, load_qa_pairs
+from rag_pipeline import RAGPipeline, AsyncRAGPipeline
+
+# End-to-end benchmark of the RAG pipeline with no API keys: Gemini is replaced
+# by a deterministic fake with configurable latency and Pinecone by the local
+# embedding stores, everything else (classifier, hybrid retrieval, context
+# assembly) is the real code. Replays questions derived from the FAQs and the
+# curated issues at several concurrency levels and reports throughput,
+# p50/p95/p99 and the per-stage breakdown. Each run is saved to
+# benchmark_results/ and compared with the previous one.
+#
+#   python benchmark_pipeline.py --concurrency 1 4 16 --llm-ms 400
+#   python benchmark_pipeline.py --embedder model --mode async
+
+# --- Configuration ---
+RESULTS_DIR = "benchmark_results"
+QUERY_SOURCES = FAQ_SOURCES
+PRODUCT_KEYWORDS = {
+    "fridge": ("fridge", "refrigerator", "freezer", "ice"),
+    "microwave": ("microwave", "oven", "grill", "turntable"),
+}
+EMBEDDING_DIMENSION = 384
+
+
+# --- 1. Query set ---
+
+def load_queries():
+    """Returns (product, question) pairs: every curated issue plus the FAQ section headings."""
+    queries = []
+    for product, sources in QUERY_SOURCES.items():
+        issues_path = sources.get("issues")
+        if issues_path and os.path.exists(issues_path):
+            with open(issues_path, "r", encoding="utf-8") as f:
+                queries.extend((product, json.loads(line)["issue"]) for line in f if line.strip())
+        faqs_path = sources.get("faqs")
+        if faqs_path and os.path.exists(faqs_path):
+            with open(faqs_path, "r", encoding="utf-8") as f:
+                queries.extend((product, heading) for heading in faq_headings(f.read()))
+    return queries
+
+
+def faq_headings(text):
+    """Short lines that open a paragraph and don't end like a sentence are taken as FAQ headings."""
+    headings = []
+    for block in re.split(r"\n\s*\n", text):
+        first_line = block.strip().split("\n")[0].strip()
+        if 15 <= len(first_line) <= 100 and not first_line.endswith((".", ":", ",")) and " " in first_line:
+            headings.append(first_line)
+    return headings
+
+
+# --- 2. Local stand-ins ---
+
+class FakeEmbeddingModel:
+    """Deterministic pseudo-embeddings (seeded by the text) with a fixed encode latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def encode(self, text):
+        time.sleep(self.latency)
+        if not isinstance(text, str):
+            return np.vstack([self._vector(t) for t in text])
+        return self._vector(text)
+
+    @staticmethod
+    def _vector(text):
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSION).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = completion_tokens
+
+
+class FakeResponse:
+    def __init__(self, prompt, text):
+        self.text = text
+        self.usage_metadata = FakeUsage(estimate_tokens(prompt), estimate_tokens(text))
+
+    def __iter__(self):
+        # stream=True yields the answer as a single chunk
+        return iter([self])
+
+
+class FakeGeminiModel:
+    """
+    Stands in for genai.GenerativeModel. Classification prompts get a keyword
+    guess at the product; answer prompts echo the start of the context.
+    Latency is llm_ms ± jitter, for both the sync and async calls.
+    """
+
+    def __init__(self, latency, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def _delay(self):
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _reply(self, prompt):
+        if "Category:" in prompt:
+            # Only the quoted question: the rest of the prompt lists every category
+            match = re.search(r'Question: "(.*)"', prompt, re.DOTALL)
+            question = (match.group(1) if match else prompt).lower()
+            for product, keywords in PRODUCT_KEYWORDS.items():
+                if any(keyword in question for keyword in keywords):
+                    return FakeResponse(prompt, product)
+            return FakeResponse(prompt, "washing_machine")
+        context = prompt.split("CONTEXT:", 1)[-1].strip()
+        return FakeResponse(prompt, "Based on the manual: " + " ".join(context.split()[:60]))
+
+    def generate_content(self, prompt, stream=False):
+        time.sleep(self._delay())
+        return self._reply(prompt)
+
+    async def generate_content_async(self, prompt, stream=False):
+        await asyncio.sleep(self._delay())
+        response = self._reply(prompt)
+        if not stream:
+            return response
+
+        async def chunks():
+            yield response
+        return chunks()
+
+
+def build_clients(args):
+    if args.embedder == "model":
+        import services
+        embedding_model = services.get_embedding_model()
+    else:
+        embedding_model = FakeEmbeddingModel(args.embed_ms / 1000)
+    index = LocalIndex()
+    retriever = HybridRetriever(index, KeywordIndex()) if HYBRID_RETRIEVAL else None
+    answer_cache = AnswerCache() if args.cache else AnswerCache(max_entries=0)
+    gemini_model = FakeGeminiModel(args.llm_ms / 1000, args.llm_jitter_ms / 1000)
+    if args.llm_rpm:
+        # Exercise the rate limiter and the degraded (passages-only) answers
+        gemini_model = GeminiClient(gemini_model, requests_per_minute=args.llm_rpm)
+    return (embedding_model, index, gemini_model, ProductClassifier(), answer_cache), retriever
+
+
+def build_faq_index(args, embedding_model):
+    """The FAQ fast path, built in memory with the benchmark's embedder, or None without --faq."""
+    if not args.faq:
+        return None
+    return FaqIndex.from_pairs(embedding_model, load_qa_pairs())
+
+
+# --- 3. Runners ---
+
+def timed_sync(pipeline, query):
+    metrics.start_request()
+    start = time.perf_counter()
+    pipeline.get_answer(query)
+    return time.perf_counter() - start, metrics.current_spans(), metrics.current_answer_source()
+
+
+def run_sync(pipeline, queries, concurrency):
+    """The Flask app's path: get_answer on a pool of worker threads."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as workers:
+        results = list(workers.map(lambda query: timed_sync(pipeline, query), queries))
+    return time.perf_counter() - start, results
+
+
+def run_async(pipeline, queries, concurrency):
+    """The Quart app's path: get_answer_async with `concurrency` requests in flight."""
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(query):
+            async with semaphore:
+                metrics.start_request()
+                start = time.perf_counter()
+                await pipeline.get_answer_async(query)
+                return time.perf_counter() - start, metrics.current_spans(), metrics.current_answer_source()
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(query) for query in queries))
+        return time.perf_counter() - start, results
+
+    return asyncio.run(main())
+
+
+def summarize(seconds, results):
+    latencies = np.array([latency for latency, _, _ in results]) * 1000
+    stages = {}
+    sources = {}
+    for latency, spans, source in results:
+        for stage, stage_seconds in spans.items():
+            stages.setdefault(stage, []).append(stage_seconds * 1000)
+        sources.setdefault(source or "none", []).append(latency * 1000)
+    return {
+        "requests": len(results),
+        "throughput_rps": len(results) / seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "stages": {
+            stage: {
+                "count": len(values),
+                "mean_ms": float(np.mean(values)),
+                "p95_ms": float(np.percentile(values, 95)),
+            }
+            for stage, values in sorted(stages.items())
+        },
+        # Where answers came from (faq, cache, llm, degraded): share of requests and their latency
+        "answer_sources": {
+            source: {
+                "share": len(values) / len(results),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+            }
+            for source, values in sorted(sources.items())
+        },
+    }
+
+
+# --- 4. Reporting ---
+
+def print_level(concurrency, summary, previous=None):
+    line = (f"{concurrency:>11}{summary['throughput_rps']:>10.1f}{summary['p50_ms']:>10.1f}"
+            f"{summary['p95_ms']:>10.1f}{summary['p99_ms']:>10.1f}")
+    if previous:
+        change = (summary["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+        line += f"   p95 {change:+.1f}% vs previous"
+    print(line)
+    for stage, stage_summary in summary["stages"].items():
+        print(f"{'':>13}{stage:<18}{stage_summary['count']:>6} calls  mean {stage_summary['mean_ms']:8.2f}ms"
+              f"  p95 {stage_summary['p95_ms']:8.2f}ms")
+    for source, source_summary in summary.get("answer_sources", {}).items():
+        print(f"{'':>13}answers: {source:<9}{source_summary['share']:>6.0%} of requests  "
+              f"p50 {source_summary['p50_ms']:8.2f}ms  p95 {source_summary['p95_ms']:8.2f}ms")
+
+
+def latest_result(mode):
+    """The most recent saved run for this mode, or None."""
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    for filename in sorted(os.listdir(RESULTS_DIR), reverse=True):
+        if filename.endswith(".json"):
+            with open(os.path.join(RESULTS_DIR, filename), "r", encoding="utf-8") as f:
+                result = json.load(f)
+            if result["config"]["mode"] == mode:
+                return result
+    return None
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the RAG pipeline.")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--repeat", type=int, default=1, help="Times to replay the query set per level.")
+    parser.add_argument("--embedder", choices=["fake", "model"], default="fake",
+                        help="fake: seeded vectors with --embed-ms latency; model: the real embedding model.")
+    parser.add_argument("--embed-ms", type=float, default=5)
+    parser.add_argument("--llm-ms", type=float, default=400)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-rpm", type=float, default=0,
+                        help="Put the fake LLM behind GeminiClient with this quota (0 = no limiter).")
+    parser.add_argument("--cache", action="store_true", help="Enable the answer cache (off by default).")
+    parser.add_argument("--faq", action="store_true",
+                        help="Enable the FAQ fast path (off by default: the query set is the FAQ questions).")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's per-request logging.")
+    args = parser.parse_args()
+
+    queries = [question for _, question in load_queries()] * args.repeat
+    clients, retriever = build_clients(args)
+    faq_index = build_faq_index(args, clients[0])
+    if args.mode == "sync":
+        pipeline, run = RAGPipeline(*clients, retriever=retriever, faq_index=faq_index), run_sync
+    else:
+        pipeline, run = AsyncRAGPipeline(*clients, retriever=retriever, faq_index=faq_index), run_async
+
+    previous = latest_result(args.mode)
+    print(f"{len(queries)} queries, {args.mode} pipeline, embedder {args.embedder}, "
+          f"LLM {args.llm_ms}±{args.llm_jitter_ms}ms, hybrid retrieval {'on' if retriever else 'off'}")
+    if previous:
+        print(f"Comparing with the run from {previous['timestamp']}")
+    print(f"{'concurrency':>11}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    levels = {}
+    pipeline_output = sys.stdout if args.verbose else open(os.devnull, "w")
+    for concurrency in args.concurrency:
+        with contextlib.redirect_stdout(pipeline_output):
+            seconds, results = run(pipeline, queries, concurrency)
+        levels[str(concurrency)] = summarize(seconds, results)
+        print_level(concurrency, levels[str(concurrency)], previous and previous["levels"].get(str(concurrency)))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_path = os.path.join(RESULTS_DIR, f"{timestamp}-{args.mode}.json")
+    config = {key: value for key, value in vars(args).items() if key != "verbose"}
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": timestamp, "config": config, "queries": len(queries), "levels": levels}, f, indent=2)
+    print(f"\nSaved results to '{output_path}'")
@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import tracemalloc
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from product_classifier import EMBEDDING_FILES
+from vector_store import STORE_DTYPES, VectorStore, normalize_rows, write_store
+
+# Compares the list-of-floats embeddings parquet files with the vector store
+# format (float32, float16, int8): file size, load time, memory and
+# top-k agreement with the float32 scores. Each load runs in a fresh
+# subprocess so its peak memory isn't hidden by an earlier one. Our files are
+# small, so --scale N also benchmarks each product tiled N times (with noise).
+#
+#   python benchmark_vector_store.py --scale 100 --top-k 5
+
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def load(kind, path):
+    """Loads one file the way the app does and returns a float32 matrix (or store) ready to query."""
+    if kind == "parquet":
+        df = pd.read_parquet(path)
+        return normalize_rows(np.vstack(df["embedding"].to_numpy()).astype(np.float32))
+    return VectorStore(path)
+
+
+def child(kind, path, queries_path):
+    """Runs in the subprocess: prints load time, peak memory and the query scores as JSON."""
+    queries = np.load(queries_path)
+    baseline_mb = current_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    loaded = load(kind, path)
+    load_seconds = time.perf_counter() - start
+    _, peak_heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    scores = np.vstack([loaded @ query if kind == "parquet" else loaded.scores(query) for query in queries])
+    query_seconds = (time.perf_counter() - start) / len(queries)
+    print(json.dumps({
+        "load_ms": load_seconds * 1000,
+        "query_ms": query_seconds * 1000,
+        # Heap is what the load allocated; RSS growth also counts the mapped pages queries touched
+        "peak_heap_mb": peak_heap / 2 ** 20,
+        "rss_growth_mb": current_rss_mb() - baseline_mb,
+        "scores": scores.tolist(),
+    }))
+
+
+def run_child(kind, path, queries_path):
+    output = subprocess.run([sys.executable, __file__, "--child", kind, path, queries_path],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def scaled_parquet(file_path, scale, work_dir):
+    """Writes the file tiled `scale` times, with noise on the copies, in the old list-of-floats format."""
+    df = pd.read_parquet(file_path)
+    vectors = np.vstack(df["embedding"].to_numpy()).astype(np.float32)
+    rng = np.random.default_rng(0)
+    tiled = np.vstack([vectors] + [vectors + rng.normal(0, 0.02, vectors.shape).astype(np.float32)
+                                   for _ in range(scale - 1)])
+    scaled = pd.concat([df.drop(columns=["embedding"])] * scale, ignore_index=True)
+    scaled["chunk_id"] = np.arange(len(scaled))
+    scaled["embedding"] = normalize_rows(tiled).astype(np.float64).tolist()
+    path = os.path.join(work_dir, os.path.basename(file_path).replace(".parquet", f"_x{scale}.parquet"))
+    scaled.to_parquet(path)
+    return path
+
+
+def overlap_at_k(scores, reference, k):
+    """Mean fraction of the reference top-k found in the top-k of `scores`."""
+    hits = [len(set(np.argsort(-s)[:k]) & set(np.argsort(-r)[:k])) / k for s, r in zip(scores, reference)]
+    return float(np.mean(hits))
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:5])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark embedding parquet files against vector stores.")
+    parser.add_argument("--queries", type=int, default=50, help="Random query vectors per file.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1, help="Also benchmark each file tiled this many times.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for product, file_path in EMBEDDING_FILES.items():
+            if not os.path.exists(file_path):
+                print(f"Skipping {product}: '{file_path}' not found.")
+                continue
+            if args.scale > 1:
+                file_path = scaled_parquet(file_path, args.scale, work_dir)
+                product = f"{product} x{args.scale}"
+            # Built in work_dir, never in the live store directory next to the parquet file
+            df = pd.read_parquet(file_path)
+            float32_path = os.path.join(work_dir, f"{product}_float32")
+            write_store(float32_path, np.vstack(df["embedding"].to_numpy()), df.drop(columns=["embedding"]),
+                        "float32")
+            store = VectorStore(float32_path)
+            dimension = store.vectors.shape[1]
+
+            # Queries are perturbed stored vectors, so their nearest neighbours are meaningful
+            rng = np.random.default_rng(0)
+            rows = store.dense()[rng.integers(0, len(store), args.queries)]
+            queries = normalize_rows(rows + rng.normal(0, 0.05, (args.queries, dimension)).astype(np.float32))
+            queries_path = os.path.join(work_dir, f"{product}_queries.npy")
+            np.save(queries_path, queries)
+
+            candidates = {"parquet": file_path, "float32": float32_path}
+            for dtype in STORE_DTYPES[1:]:
+                path = os.path.join(work_dir, f"{product}_{dtype}")
+                write_store(path, store.dense(), store.metadata, dtype)
+                candidates[dtype] = path
+
+            print(f"\n--- {product}: {len(store)} vectors x {dimension} ---")
+            print(f"{'format':<10}{'size':>10}{'load':>10}{'query':>10}{'peak heap':>11}{'RSS +':>10}"
+                  f"{f'top-{args.top_k}':>8}")
+            results = {kind: run_child(kind, path, queries_path) for kind, path in candidates.items()}
+            reference = np.array(results["float32"]["scores"])
+            for kind, result in results.items():
+                agreement = overlap_at_k(np.array(result["scores"]), reference, args.top_k)
+                print(f"{kind:<10}{directory_size(candidates[kind]) / 1024:>8.0f}KB{result['load_ms']:>8.1f}ms"
+                      f"{result['query_ms']:>8.3f}ms{result['peak_heap_mb']:>9.1f}MB{result['rss_growth_mb']:>8.1f}MB"
+                      f"{agreement:>8.2f}")
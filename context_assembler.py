@@ -0,0 +1,105 @@
+import os
+import re
+
+# --- Configuration ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Word-shingle overlap above which a passage is treated as a near-duplicate
+NEAR_DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+# Longest overlap looked for when stitching adjacent chunks back together
+# (smart_chunker overlaps by 100 characters)
+MAX_STITCH_OVERLAP = 300
+PASSAGE_SEPARATOR = "\n---\n"
+
+
+def estimate_tokens(text):
+    """Rough Gemini token count (about 4 characters per token for English)."""
+    return (len(text) + 3) // 4
+
+
+def _source_and_position(match):
+    """Splits a "<product>-<source>-<chunk_id>" vector id into (source, chunk_id)."""
+    prefix, _, chunk_id = match["id"].rpartition("-")
+    source = match["metadata"].get("source", prefix)
+    return (source, int(chunk_id)) if chunk_id.isdigit() else (source, None)
+
+
+def _stitch(first, second):
+    """Appends second to first, dropping the text they share at the seam."""
+    for size in range(min(MAX_STITCH_OVERLAP, len(first), len(second)), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n\n" + second
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def merge_adjacent(matches):
+    """
+    Merges retrieved chunks that are consecutive in the same source into one
+    passage (removing their overlap). Each passage keeps its best score.
+    """
+    passages = []
+    for match in matches:
+        source, chunk_id = _source_and_position(match)
+        passage = {"text": match["metadata"]["text"], "score": match.get("score", 0.0),
+                   "source": source, "first": chunk_id, "last": chunk_id}
+        passages.append(passage)
+
+    merged = []
+    for passage in sorted(passages, key=lambda p: (p["source"], p["first"] if p["first"] is not None else -1)):
+        previous = merged[-1] if merged else None
+        if (previous is not None and passage["first"] is not None and previous["last"] is not None
+                and previous["source"] == passage["source"] and passage["first"] == previous["last"] + 1):
+            previous["text"] = _stitch(previous["text"], passage["text"])
+            previous["last"] = passage["last"]
+            previous["score"] = max(previous["score"], passage["score"])
+        else:
+            merged.append(dict(passage))
+    return merged
+
+
+def assemble_context(matches, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Builds the prompt context from retrieved matches: merges adjacent chunks,
+    drops passages that are near-duplicates of a higher-scoring one, then
+    adds passages by descending score while they fit in token_budget.
+    Returns (context, stats).
+    """
+    passages = sorted(merge_adjacent(matches), key=lambda p: p["score"], reverse=True)
+
+    kept, kept_shingles = [], []
+    for passage in passages:
+        shingles = _shingles(passage["text"])
+        duplicate = any(
+            len(shingles & other) / min(len(shingles), len(other)) >= NEAR_DUPLICATE_THRESHOLD
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(passage)
+            kept_shingles.append(shingles)
+
+    selected, used_tokens = [], 0
+    for passage in kept:
+        tokens = estimate_tokens(passage["text"] + PASSAGE_SEPARATOR)
+        # The best passage is always kept, even if it alone exceeds the budget
+        if used_tokens + tokens > token_budget and selected:
+            continue
+        selected.append(passage["text"])
+        used_tokens += tokens
+
+    context = "".join(text + PASSAGE_SEPARATOR for text in selected)
+    stats = {
+        "retrieved": len(matches),
+        "after_merge": len(passages),
+        "after_dedup": len(kept),
+        "used": len(selected),
+        "retrieved_tokens": sum(estimate_tokens(m["metadata"]["text"] + PASSAGE_SEPARATOR) for m in matches),
+        "context_tokens": estimate_tokens(context),
+    }
+    return context, stats
@@ -1,11 +1,28 @@
 import os
+import re
+import json
+import time
+import hashlib
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer
+from embedding_backends import EMBEDDING_BACKEND, load_embedding_model
+from vector_store import STORE_DTYPE, open_store, store_path_for, write_store
+from product_registry import PRODUCTS
+from faq_index import FAQ_FAST_PATH, build_faq_index
 
 # --- Configuration (doesn't change) ---
 MAX_CHUNK_SIZE = 1500
 CHUNK_OVERLAP = 100
 MODEL_NAME = 'all-MiniLM-L6-v2'
+# "tokens" (token_chunker) or "chars" (the original smart_chunker)
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "tokens")
+# all-MiniLM-L6-v2 truncates at 256 word pieces, including [CLS] and [SEP]
+MAX_CHUNK_TOKENS = 254
+CHUNK_OVERLAP_TOKENS = 32
+# Bump when the chunk text layout changes in a way the parameters above don't capture
+CHUNKER_VERSION = 2
+# Must match process_data.SOURCE_MARKER
+SOURCE_MARKER = "### SOURCE: "
 
 def smart_chunker(text, chunk_size, chunk_overlap):
     """A more robust function to split text into consistently sized chunks."""
@@ -26,76 +43,261 @@ def smart_chunker(text, chunk_size, chunk_overlap):
                 start += (chunk_size - chunk_overlap)
     return final_chunks
 
+# Record separator written between JSONL entries by process_data
+RECORD_SEPARATOR = re.compile(r"\n-{3,}\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def _split_oversized(text, count_tokens, max_tokens):
+    """Splits one sentence that alone exceeds max_tokens into word windows that fit."""
+    pieces, current = [], []
+    for word in text.split():
+        if current and count_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+def token_chunker(text, count_tokens, max_tokens=MAX_CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Splits text into chunks that fit the embedding model's token limit.
+    Records separated by '---' (the JSONL issue/solution entries) never share
+    a chunk and are only split if one record alone is too long. Within a
+    record, whole paragraphs and then whole sentences are packed together;
+    consecutive chunks of the same record overlap by up to overlap_tokens
+    worth of trailing sentences.
+    """
+    final_chunks = []
+    for record in RECORD_SEPARATOR.split(text):
+        record = record.strip()
+        if not record:
+            continue
+        if count_tokens(record) <= max_tokens:
+            final_chunks.append(record)
+            continue
+
+        # Break the record into sentence-sized units, remembering paragraph starts
+        units = []
+        for paragraph in record.split("\n\n"):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            for i, sentence in enumerate(SENTENCE_END.split(paragraph)):
+                for piece in ([sentence] if count_tokens(sentence) <= max_tokens
+                              else _split_oversized(sentence, count_tokens, max_tokens)):
+                    units.append((piece, i == 0, count_tokens(piece)))
+
+        current, current_tokens = [], 0
+        for piece, starts_paragraph, tokens in units:
+            if current and current_tokens + tokens > max_tokens:
+                final_chunks.append(_join_units(current))
+                # Carry trailing sentences over as overlap
+                overlap, overlap_size = [], 0
+                for unit in reversed(current):
+                    if overlap_size + unit[2] > overlap_tokens or overlap_size + unit[2] + tokens > max_tokens:
+                        break
+                    overlap.insert(0, unit)
+                    overlap_size += unit[2]
+                current, current_tokens = overlap, overlap_size
+            current.append((piece, starts_paragraph, tokens))
+            current_tokens += tokens
+        if current:
+            final_chunks.append(_join_units(current))
+    return final_chunks
+
+def _join_units(units):
+    text = ""
+    for piece, starts_paragraph, _ in units:
+        separator = "\n\n" if starts_paragraph else " "
+        text += (separator if text else "") + piece
+    return text
+
+def chunk_text(text, model):
+    """Chunks text with the configured CHUNKING_STRATEGY."""
+    if CHUNKING_STRATEGY == "chars":
+        return smart_chunker(text, MAX_CHUNK_SIZE, CHUNK_OVERLAP)
+    count_tokens = lambda t: len(model.tokenizer.tokenize(t))
+    return token_chunker(text, count_tokens)
+
+def split_sources(text, default_source):
+    """
+    Splits a processed text file on the SOURCE_MARKER lines written by
+    process_data into (source filename, text) pairs. Files without markers
+    are a single source named after the file itself.
+    """
+    sections = []
+    source, lines = default_source, []
+    for line in text.split("\n"):
+        if line.startswith(SOURCE_MARKER):
+            if "".join(lines).strip():
+                sections.append((source, "\n".join(lines)))
+            source, lines = line[len(SOURCE_MARKER):].strip(), []
+        else:
+            lines.append(line)
+    if "".join(lines).strip():
+        sections.append((source, "\n".join(lines)))
+    return sections
+
+def chunk_hash(text):
+    """Hashes a chunk together with everything that affects its embedding."""
+    key = f"{json.dumps(chunk_settings(), sort_keys=True)}|{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def file_hash(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def manifest_path_for(output_filename):
+    return output_filename.replace(".parquet", ".manifest.json")
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_stored_embeddings(output_filename, manifest):
+    """
+    Returns {content_hash: embedding} from the previous run, or {} when there is
+    no usable previous output (missing, or built with other model/chunk settings).
+    """
+    if manifest is None:
+        return {}
+    if manifest.get("settings") != chunk_settings():
+        print("Model or chunking settings changed; re-embedding everything.")
+        return {}
+    store = open_store(output_filename)
+    if store is None:
+        return {}
+    return dict(zip(store.metadata["content_hash"], store.dense()))
+
+def chunk_settings():
+    return {
+        "model_name": MODEL_NAME,
+        "backend": EMBEDDING_BACKEND,
+        "chunker_version": CHUNKER_VERSION,
+        "strategy": CHUNKING_STRATEGY,
+        "max_chunk_size": MAX_CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "max_chunk_tokens": MAX_CHUNK_TOKENS,
+        "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        # int8/float16 stores are lossy, so reusing their vectors for another dtype would compound it
+        "store_dtype": STORE_DTYPE,
+    }
+
 # --- NEW: Reusable Main Function ---
-def generate_embeddings_for_product(data_folder, product_name, model):
+def generate_embeddings_for_product(data_folder, product_name, model, output_filename=None):
     """
-    Loads text from a folder, chunks it, creates embeddings, and saves to a Parquet file.
+    Loads text from a folder, chunks it, creates embeddings, and saves them as a
+    vector store (see vector_store.py) in '<product>_embeddings/' (or the store
+    for output_filename, the product's embedding_file in products.json).
+    Incremental: chunks whose content hash is already in the previous output reuse
+    its embedding, so only new or changed chunks are encoded. A manifest next to
+    the store records the settings and source file hashes of the last run.
     """
     print(f"--- Processing product: {product_name.upper()} ---")
-    
+    # The store lives in store_path_for(output_filename); the .parquet name is the product's key
+    output_filename = output_filename or f'{product_name}_embeddings.parquet'
+    store_path = store_path_for(output_filename)
+    manifest_path = manifest_path_for(output_filename)
+    manifest = load_manifest(manifest_path)
+
+    source_files = sorted(f for f in os.listdir(data_folder) if f.endswith(".txt")) # Assuming you have processed .txt files for each product
+    source_hashes = {f: file_hash(os.path.join(data_folder, f)) for f in source_files}
+
+    # Nothing to do if no source file changed since the last run
+    if (manifest is not None and os.path.exists(store_path)
+            and manifest.get("settings") == chunk_settings()
+            and manifest.get("sources") == source_hashes):
+        print(f"No changes since last run. '{store_path}/' is up to date.\n")
+        return
+
     # 1. Load the text and create chunks with metadata
     all_chunks = []
-    for filename in os.listdir(data_folder):
-        if filename.endswith(".txt"): # Assuming you have processed .txt files for each product
-            file_path = os.path.join(data_folder, filename)
-            with open(file_path, "r", encoding="utf-8") as f:
-                text_content = f.read()
-                file_chunks = smart_chunker(text_content, MAX_CHUNK_SIZE, CHUNK_OVERLAP)
-                
-                # Add metadata, including the crucial product_type tag
-                for i, chunk in enumerate(file_chunks):
-                    chunk_metadata = {
-                        "source": filename,
-                        "chunk_id": i,
-                        "text": chunk,
-                        "product_type": product_name # <-- KEY ADDITION
-                    }
-                    all_chunks.append(chunk_metadata)
-    
+    for filename in source_files:
+        file_path = os.path.join(data_folder, filename)
+        with open(file_path, "r", encoding="utf-8") as f:
+            text_content = f.read()
+
+        # Merged files from process_data keep track of the original source files
+        for source, source_text in split_sources(text_content, filename):
+            file_chunks = chunk_text(source_text, model)
+
+            # Add metadata, including the crucial product_type tag
+            for i, chunk in enumerate(file_chunks):
+                chunk_metadata = {
+                    "source": source,
+                    "chunk_id": i,
+                    "text": chunk,
+                    "product_type": product_name, # <-- KEY ADDITION
+                    "content_hash": chunk_hash(chunk)
+                }
+                all_chunks.append(chunk_metadata)
+
     if not all_chunks:
         print(f"Warning: No text files found in {data_folder}. Skipping.")
         return
 
     print(f"Created {len(all_chunks)} chunks for {product_name}.")
 
-    # 2. Create the Embeddings for all chunks
-    print(f"Creating embeddings for {product_name} chunks...")
-    texts_to_embed = [chunk['text'] for chunk in all_chunks]
-    embeddings = model.encode(texts_to_embed, show_progress_bar=True)
-    
-    # 3. Store the Text and its Vector Together
-    output_filename = f'{product_name}_embeddings.parquet'
-    print(f"Saving chunks and embeddings to '{output_filename}'...")
+    # 2. Reuse stored embeddings and only encode new or changed chunks
+    stored = load_stored_embeddings(output_filename, manifest)
+    to_embed = sorted({chunk["content_hash"]: chunk["text"] for chunk in all_chunks
+                       if chunk["content_hash"] not in stored}.items())
+    current_hashes = {chunk["content_hash"] for chunk in all_chunks}
+    removed = len(set(stored) - current_hashes)
+    print(f"Reusing {len(current_hashes) - len(to_embed)} stored embeddings, "
+          f"embedding {len(to_embed)} new/changed chunks, dropping {removed} removed chunks.")
+
+    start = time.perf_counter()
+    if to_embed:
+        print(f"Creating embeddings for {product_name} chunks...")
+        new_embeddings = model.encode([text for _, text in to_embed], show_progress_bar=True)
+        stored.update(zip((h for h, _ in to_embed), np.asarray(new_embeddings, dtype=np.float32)))
+    print(f"Embedding step took {time.perf_counter() - start:.1f}s.")
+
+    # 3. Store the vectors as one contiguous block, with the chunk table alongside
+    print(f"Saving chunks and {STORE_DTYPE} embeddings to '{store_path}/'...")
     df = pd.DataFrame(all_chunks)
-    df['embedding'] = embeddings.tolist()
-    df.to_parquet(output_filename)
-    
-    print(f"Successfully created '{output_filename}'.\n")
+    write_store(store_path, np.vstack([stored[h] for h in df['content_hash']]), df)
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "settings": chunk_settings(),
+            "sources": source_hashes,
+            "chunk_count": len(all_chunks),
+            "embedded_count": len(to_embed),
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }, f, indent=2)
+
+    print(f"Successfully created '{store_path}/'.\n")
 
 # --- SCRIPT EXECUTION ---
 if __name__ == "__main__":
-    # First, make sure you have processed text files in these folders
-    # (e.g., from a 'process_data.py' script)
-    product_folders = {
-        "microwave": "processed_text/microwave",
-        "washing_machine": "processed_text/washing_machine",
-        "fridge": "processed_text/fridge"
-    }
+    # First, make sure you have processed text files in each product's data_folder
+    # (e.g., from a 'process_data.py' script); the products come from products.json
 
     # Load the model once to be efficient
     print("Loading the embedding model...")
-    embedding_model = SentenceTransformer(MODEL_NAME)
+    embedding_model = load_embedding_model(MODEL_NAME)
     print("Model loaded successfully.\n")
 
     # Loop through and process each product
-    for name, folder in product_folders.items():
+    for name, product in PRODUCTS.items():
+        folder = product["data_folder"]
         if os.path.exists(folder):
             generate_embeddings_for_product(
                 data_folder=folder, 
                 product_name=name, 
-                model=embedding_model
+                model=embedding_model,
+                output_filename=product["embedding_file"]
             )
         else:
             print(f"Warning: Data folder not found at '{folder}'. Skipping {name}.")
 
+    # The FAQ fast path's index is built here too, so servers don't have to at startup
+    if FAQ_FAST_PATH:
+        build_faq_index(embedding_model)
+
     print("--- All products processed! ---")
\ No newline at end of file
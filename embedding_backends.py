@@ -0,0 +1,120 @@
+import os
+import numpy as np
+
+# --- Configuration ---
+# "torch" (SentenceTransformer), "onnx" (exported graph) or "onnx-int8" (dynamically quantized)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = "onnx_models"
+MAX_SEQ_LENGTH = 256
+
+
+def export_onnx(model_name, output_dir, quantize=False):
+    """
+    Exports the SentenceTransformer's transformer to ONNX (plus its tokenizer)
+    into output_dir, and optionally writes a dynamically int8-quantized copy.
+    Only needed once per model; needs torch, inference afterwards does not.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    onnx_path = os.path.join(output_dir, "model.onnx")
+    if not os.path.exists(onnx_path):
+        print(f"Exporting {model_name} to '{onnx_path}'...")
+        st_model = SentenceTransformer(model_name, device="cpu")
+        transformer = st_model[0].auto_model.eval()
+        st_model.tokenizer.save_pretrained(output_dir)
+
+        dummy = st_model.tokenizer(["export example"], return_tensors="pt")
+        input_names = ["input_ids", "attention_mask", "token_type_ids"]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+        export_args = dict(input_names=input_names, output_names=["last_hidden_state"],
+                           dynamic_axes=dynamic_axes, opset_version=14)
+        with torch.no_grad():
+            try:
+                torch.onnx.export(transformer, tuple(dummy[name] for name in input_names), onnx_path,
+                                  dynamo=False, **export_args)
+            except TypeError:
+                # Older torch without the dynamo switch
+                torch.onnx.export(transformer, tuple(dummy[name] for name in input_names), onnx_path,
+                                  **export_args)
+
+    quantized_path = os.path.join(output_dir, "model.int8.onnx")
+    if quantize and not os.path.exists(quantized_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"Quantizing to '{quantized_path}'...")
+        quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path if quantize else onnx_path
+
+
+class OnnxEmbedder:
+    """
+    Runs all-MiniLM-L6-v2 through onnxruntime with the same interface as
+    SentenceTransformer.encode (mean pooling + L2 normalization, as in the
+    original model's pipeline).
+    """
+
+    def __init__(self, model_name, quantize=False, model_dir=ONNX_MODEL_DIR, normalize=True):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        output_dir = os.path.join(model_dir, model_name.replace("/", "_"))
+        onnx_path = export_onnx(model_name, output_dir, quantize=quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(output_dir)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        # all-MiniLM-L6-v2's pipeline ends in a Normalize layer; False for models without one
+        self.normalize = normalize
+
+    def _encode_batch(self, sentences):
+        tokens = self.tokenizer(sentences, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH,
+                                return_tensors="np")
+        inputs = {name: tokens[name].astype(np.int64) for name in self._input_names}
+        hidden = self.session.run(None, inputs)[0]
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, normalize_embeddings=False,
+               convert_to_numpy=True):
+        """
+        Same call shape and results as SentenceTransformer.encode (numpy output
+        only; other SentenceTransformer arguments aren't supported and raise
+        TypeError). As there, the model's own normalization always applies and
+        normalize_embeddings=True normalizes on top of it (a no-op for this model).
+        """
+        if not convert_to_numpy:
+            raise ValueError("OnnxEmbedder only returns numpy arrays (convert_to_numpy=True)")
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        if not sentences:
+            return np.empty((0, 0), dtype=np.float32)
+        # Sorting by length keeps padding (and wasted compute) per batch small
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        vectors = np.empty((len(sentences), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            embedded = self._encode_batch([sentences[i] for i in batch]).astype(np.float32)
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(sentences), embedded.shape[1]), dtype=np.float32)
+            vectors[batch] = embedded
+        if normalize_embeddings:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors[0] if single else vectors
+
+
+def load_embedding_model(model_name, backend=None):
+    """Returns an object with SentenceTransformer's encode() for the configured backend."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        return OnnxEmbedder(model_name)
+    if backend == "onnx-int8":
+        return OnnxEmbedder(model_name, quantize=True)
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}' (use torch, onnx or onnx-int8)")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from create_embeddings_v2 import (MODEL_NAME, MAX_CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNK_TOKENS,
+                                  CHUNK_OVERLAP_TOKENS, smart_chunker, token_chunker, split_sources)
+from product_registry import PRODUCTS
+
+# Offline retrieval-quality check for the chunking strategies. Each curated
+# issue is used as a query against the product's processed text; a hit is a
+# retrieved chunk that contains that issue's full solution.
+#
+#   python evaluate_chunking.py --k 1 3 5
+
+# --- Configuration ---
+# Every product with curated issues: (issues file, processed text folder)
+EVAL_SETS = {name: (product["issues"], product["data_folder"]) for name, product in PRODUCTS.items()
+             if product["issues"]}
+
+
+def load_issues(jsonl_path):
+    """Returns (issue, solution) pairs from an issues .jsonl file."""
+    pairs = []
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                pairs.append((record["issue"], record["solution"]))
+    return pairs
+
+
+def load_texts(folder):
+    texts = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".txt"):
+            with open(os.path.join(folder, filename), "r", encoding="utf-8") as f:
+                texts.extend(text for _, text in split_sources(f.read(), filename))
+    return texts
+
+
+def build_strategies(model):
+    count_tokens = lambda t: len(model.tokenizer.tokenize(t))
+    return {
+        "chars (smart_chunker)": lambda text: smart_chunker(text, MAX_CHUNK_SIZE, CHUNK_OVERLAP),
+        "tokens (token_chunker)": lambda text: token_chunker(text, count_tokens, MAX_CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS),
+        "tokens, 128 max": lambda text: token_chunker(text, count_tokens, 128, CHUNK_OVERLAP_TOKENS // 2),
+    }
+
+
+def evaluate(model, chunker, texts, pairs, ks):
+    chunks = [chunk for text in texts for chunk in chunker(text)]
+
+    start = time.perf_counter()
+    chunk_vectors = model.encode(chunks, normalize_embeddings=True, batch_size=64)
+    embed_seconds = time.perf_counter() - start
+
+    query_vectors = model.encode([issue for issue, _ in pairs], normalize_embeddings=True)
+    ranked = np.argsort(-(query_vectors @ chunk_vectors.T), axis=1)[:, :max(ks)]
+
+    normalize = lambda t: " ".join(t.split())
+    normalized_chunks = [normalize(chunk) for chunk in chunks]
+    recall = {}
+    for k in ks:
+        hits = sum(
+            any(normalize(solution) in normalized_chunks[i] for i in ranked[q, :k])
+            for q, (_, solution) in enumerate(pairs)
+        )
+        recall[k] = hits / len(pairs)
+    return {"chunks": len(chunks), "embed_seconds": embed_seconds, "recall": recall}
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare chunking strategies by retrieval recall@k.")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    args = parser.parse_args()
+
+    print("Loading the embedding model...")
+    model = SentenceTransformer(MODEL_NAME)
+    strategies = build_strategies(model)
+
+    for product, (issues_path, folder) in EVAL_SETS.items():
+        if not (os.path.exists(issues_path) and os.path.exists(folder)):
+            print(f"Warning: missing '{issues_path}' or '{folder}'. Skipping {product}.")
+            continue
+        pairs = load_issues(issues_path)
+        texts = load_texts(folder)
+        print(f"\n--- {product.upper()}: {len(pairs)} queries ---")
+        header = "".join(f"  recall@{k}" for k in args.k)
+        print(f"{'strategy':<24}{'chunks':>8}{'embed s':>10}{header}")
+        for name, chunker in strategies.items():
+            result = evaluate(model, chunker, texts, pairs, args.k)
+            scores = "".join(f"{result['recall'][k]:>11.2f}" for k in args.k)
+            print(f"{name:<24}{result['chunks']:>8}{result['embed_seconds']:>10.2f}{scores}")
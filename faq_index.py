@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+from vector_store import VectorStore, normalize_rows, store_lock, write_store
+from metrics import span, FAQ_LOOKUPS
+from product_registry import PRODUCTS
+
+# Curated question -> answer pairs (the FAQ pages and the *_issues.jsonl
+# solutions) with their question embeddings, stored as a vector store in
+# faq_index/. A query that is nearly the same as one of these questions gets
+# the curated answer directly, with no retrieval or Gemini call.
+#
+#   python faq_index.py    (create_embeddings_v2.py also builds it; the server
+#                           rebuilds it when missing or older than a source)
+
+# --- Configuration ---
+FAQ_FAST_PATH = os.getenv("FAQ_FAST_PATH", "1") == "1"
+FAQ_INDEX_PATH = os.getenv("FAQ_INDEX_PATH", "faq_index")
+# Cosine similarity to a curated question needed to answer from it directly
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.9"))
+# Each product's "issues" and "faqs" files from products.json
+FAQ_SOURCES = {name: {kind: product[kind] for kind in ("issues", "faqs") if product[kind]}
+               for name, product in PRODUCTS.items()}
+FAQ_COLUMNS = ["product_type", "source", "question", "answer"]
+# FAQ paragraphs that only link to other questions
+NAVIGATION_HEADINGS = ("Related Questions",)
+# FAQ sections with less text than this are merged into the one before
+MIN_ANSWER_CHARS = 100
+
+
+# --- 1. Loading the curated pairs ---
+
+def is_faq_heading(line):
+    """Short capitalized lines that open a paragraph and don't end like a sentence are FAQ headings."""
+    return (15 <= len(line) <= 100 and line[0].isupper() and not line.endswith((".", ":", ","))
+            and " " in line)
+
+
+def faq_pairs(text):
+    """
+    Splits an FAQ page into (heading, section text) pairs. A heading straight
+    after another heading is part of its section, and a section that is very
+    short or continues a wrapped sentence (lowercase start) joins the previous one.
+    """
+    sections = []
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        first_line, _, rest = block.partition("\n")
+        first_line = first_line.strip()
+        if first_line in NAVIGATION_HEADINGS:
+            continue
+        if not sections or (is_faq_heading(first_line) and sections[-1][1]):
+            sections.append([first_line, [rest.strip()] if rest.strip() else []])
+        else:
+            sections[-1][1].append(block)
+
+    pairs = []
+    for heading, body in sections:
+        answer = "\n\n".join(body)
+        if pairs and (len(answer) < MIN_ANSWER_CHARS or answer[:1].islower()):
+            pairs[-1] = (pairs[-1][0], f"{pairs[-1][1]}\n\n{heading}\n{answer}".strip())
+        elif answer:
+            pairs.append((heading, answer))
+    return pairs
+
+
+def load_qa_pairs(sources=None):
+    """Returns [{"product_type", "source", "question", "answer"}] from every FAQ and issues file."""
+    pairs = []
+    for product, files in (sources or FAQ_SOURCES).items():
+        issues_path = files.get("issues")
+        if issues_path and os.path.exists(issues_path):
+            with open(issues_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        pairs.append({"product_type": product, "source": os.path.basename(issues_path),
+                                      "question": record["issue"], "answer": record["solution"]})
+        faqs_path = files.get("faqs")
+        if faqs_path and os.path.exists(faqs_path):
+            with open(faqs_path, "r", encoding="utf-8") as f:
+                pairs.extend({"product_type": product, "source": os.path.basename(faqs_path),
+                              "question": question, "answer": answer}
+                             for question, answer in faq_pairs(f.read()))
+    return pairs
+
+
+# --- 2. Building and opening the index ---
+
+def build_faq_index(embedding_model, path=FAQ_INDEX_PATH, sources=None):
+    """Embeds every curated question and writes the index store to `path`."""
+    pairs = load_qa_pairs(sources)
+    vectors = embedding_model.encode([pair["question"] for pair in pairs])
+    write_store(path, vectors, pd.DataFrame(pairs, columns=FAQ_COLUMNS), "float32", columns=FAQ_COLUMNS)
+    print(f"FAQ index: {len(pairs)} curated answers written to '{path}/'")
+    return path
+
+
+def open_faq_index(embedding_model, path=FAQ_INDEX_PATH, sources=None):
+    """
+    Loads the FAQ index, (re)building it first if it's missing or older than
+    one of the source files. Returns None if there are no sources either.
+    """
+    source_files = [file for files in (sources or FAQ_SOURCES).values() for file in files.values()
+                    if os.path.exists(file)]
+    info_path = os.path.join(path, "store.json")
+    # Every server worker opens it at startup; the lock makes one of them build it
+    with store_lock(path):
+        if not os.path.exists(info_path) or any(
+                os.path.getmtime(file) > os.path.getmtime(info_path) for file in source_files):
+            if not source_files:
+                return None
+            print(f"Building the FAQ index in '{path}/'...")
+            build_faq_index(embedding_model, path, sources)
+        store = VectorStore(path)
+    return FaqIndex(store.dense(), store.metadata.to_dict("records"))
+
+
+# --- 3. Lookup ---
+
+class FaqIndex:
+    """
+    The curated questions' embeddings (a small dense matrix) and their
+    answers. `match` returns the entry whose question is most similar to the
+    query if it clears the threshold, otherwise None.
+    """
+
+    def __init__(self, vectors, entries, threshold=FAQ_MATCH_THRESHOLD):
+        self.vectors = normalize_rows(vectors)
+        self.entries = entries
+        self.product_types = np.array([entry["product_type"] for entry in entries], dtype=object)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)  # ms, most recent lookups
+        self.counters = {"lookups": 0, "hits": 0}
+
+    @classmethod
+    def from_pairs(cls, embedding_model, pairs, threshold=FAQ_MATCH_THRESHOLD):
+        """Builds an in-memory index (no store on disk) from load_qa_pairs() output."""
+        return cls(embedding_model.encode([pair["question"] for pair in pairs]), pairs, threshold)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def match(self, query_vector, product_type=None):
+        """
+        Returns the best entry plus its "score" if it's above the threshold,
+        else None. With a product_type, only that product's entries are considered.
+        """
+        start = time.perf_counter()
+        with span("faq_lookup"):
+            query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+            scores = self.vectors @ query
+            if product_type is not None:
+                scores = np.where(self.product_types == product_type, scores, -np.inf)
+            best = int(np.argmax(scores)) if len(scores) else None
+            hit = best is not None and bool(scores[best] >= self.threshold)
+        FAQ_LOOKUPS.inc(result="hit" if hit else "miss")
+        with self._lock:
+            self._latencies.append((time.perf_counter() - start) * 1000)
+            self.counters["lookups"] += 1
+            self.counters["hits"] += hit
+        return {**self.entries[best], "score": float(scores[best])} if hit else None
+
+    def stats(self):
+        """Returns the entry count, hit rate and lookup latency."""
+        with self._lock:
+            stats = dict(self.counters)
+            latencies = np.array(self._latencies)
+        stats["entries"] = len(self.entries)
+        stats["threshold"] = self.threshold
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["lookup_p50_ms"] = float(np.percentile(latencies, 50)) if latencies.size else 0.0
+        stats["lookup_p95_ms"] = float(np.percentile(latencies, 95)) if latencies.size else 0.0
+        return stats
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    import services
+    build_faq_index(services.get_sentence_transformer())
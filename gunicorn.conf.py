@@ -0,0 +1,23 @@
+import os
+import services
+
+# Production server config:  gunicorn app:app
+#
+# The embedding model (and classifier/local index) are loaded once here, in
+# the master, before workers are forked, so every worker shares the weights
+# copy-on-write instead of loading its own copy. Set PRELOAD_MODELS=0 to
+# load them per worker instead.
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = 120
+
+if os.getenv("PRELOAD_MODELS", "1") == "1":
+    services.preload()
+
+
+def post_fork(server, worker):
+    # Runs in the worker before app.py is imported, so its warm-up starts here
+    services.after_fork()
+    services.start_background_warmup()
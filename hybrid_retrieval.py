@@ -0,0 +1,186 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import Counter, defaultdict, deque
+import numpy as np
+from product_classifier import EMBEDDING_FILES
+from local_index import ShardCache
+from vector_store import open_store
+
+# --- Configuration ---
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+RERANK = os.getenv("RERANK", "0") == "1"
+VECTOR_TOP_K = int(os.getenv("VECTOR_TOP_K", "20"))
+KEYWORD_TOP_K = int(os.getenv("KEYWORD_TOP_K", "20"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "20"))
+RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+# Standard constants for BM25 and reciprocal rank fusion
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+# Keeps error codes like "4C/4E" or "dC" as their own tokens ("4c", "4e", "dc")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class KeywordIndex:
+    """
+    In-memory BM25 inverted index over the same chunks as the vector index,
+    one shard per product_type (loaded like LocalIndex's: resident products
+    up front, the rest on first use). Exact terms such as error codes, which
+    dense vectors match poorly, score highly here.
+    """
+
+    def __init__(self, embedding_files=None):
+        self.embedding_files = embedding_files or EMBEDDING_FILES
+        self.shards = ShardCache(self._load_shard, self.embedding_files)
+
+    def _load_shard(self, product):
+        store = open_store(self.embedding_files[product])
+        return self._build_shard(store.metadata) if store is not None else None
+
+    @staticmethod
+    def _build_shard(df):
+        postings = defaultdict(list)  # term -> [(doc, term frequency)]
+        doc_lengths = []
+        entries = []
+        for doc, row in enumerate(df.to_dict("records")):
+            terms = Counter(tokenize(row["text"]))
+            for term, frequency in terms.items():
+                postings[term].append((doc, frequency))
+            doc_lengths.append(sum(terms.values()))
+            entries.append({
+                "id": f"{row['product_type']}-{row['source']}-{row['chunk_id']}",
+                "metadata": {"text": row["text"], "source": row["source"], "product_type": row["product_type"]},
+            })
+        doc_count = len(entries)
+        idf = {term: math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+               for term, docs in postings.items()}
+        return {
+            "postings": dict(postings),
+            "idf": idf,
+            "doc_lengths": np.array(doc_lengths, dtype=np.float32),
+            "average_length": float(np.mean(doc_lengths)) if doc_lengths else 0.0,
+            "entries": entries,
+        }
+
+    def search(self, query, product_type, top_k=KEYWORD_TOP_K):
+        """Returns up to top_k matches (Pinecone match shape) ranked by BM25 score."""
+        shard = self.shards.get(product_type)
+        if shard is None:
+            return []
+        scores = np.zeros(len(shard["entries"]), dtype=np.float32)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * shard["doc_lengths"] / (shard["average_length"] or 1.0))
+        for term in set(tokenize(query)):
+            for doc, frequency in shard["postings"].get(term, ()):
+                scores[doc] += shard["idf"][term] * frequency * (BM25_K1 + 1) / (frequency + length_norm[doc])
+        candidates = np.flatnonzero(scores)
+        top = candidates[np.argsort(-scores[candidates])[:top_k]]
+        return [dict(shard["entries"][doc], score=float(scores[doc])) for doc in top]
+
+
+def reciprocal_rank_fusion(result_lists, top_k, k=RRF_K):
+    """Fuses ranked match lists by summing 1 / (k + rank) per id."""
+    fused = {}
+    for matches in result_lists:
+        for rank, match in enumerate(matches, start=1):
+            entry = fused.setdefault(match["id"], dict(match, score=0.0))
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda match: match["score"], reverse=True)[:top_k]
+
+
+class CrossEncoderReranker:
+    """Rescores (query, passage) pairs with a small cross-encoder."""
+
+    def __init__(self, model_name=RERANKER_MODEL_NAME):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name)
+
+    def rerank(self, query, matches, top_k):
+        return self.rerank_many([query], [matches], top_k)[0]
+
+    def rerank_many(self, queries, match_lists, top_k):
+        """Reranks several queries' matches with one batched predict call."""
+        pairs = [(query, match["metadata"]["text"]) for query, matches in zip(queries, match_lists)
+                 for match in matches]
+        scores = iter(self.model.predict(pairs)) if pairs else iter(())
+        results = []
+        for matches in match_lists:
+            reranked = [dict(match, score=float(next(scores))) for match in matches]
+            results.append(sorted(reranked, key=lambda match: match["score"], reverse=True)[:top_k])
+        return results
+
+
+class HybridRetriever:
+    """
+    Vector search + BM25 keyword search for one product_type, fused with
+    reciprocal rank fusion and optionally reranked by a cross-encoder.
+    Keeps recent per-stage latencies so each stage's cost is visible.
+    """
+
+    STAGES = ("vector", "keyword", "fusion", "rerank")
+
+    def __init__(self, index, keyword_index, reranker=None, vector_top_k=VECTOR_TOP_K,
+                 keyword_top_k=KEYWORD_TOP_K, rerank_top_k=RERANK_TOP_K):
+        self.index = index
+        self.keyword_index = keyword_index
+        self.reranker = reranker
+        self.vector_top_k = vector_top_k
+        self.keyword_top_k = keyword_top_k
+        self.rerank_top_k = rerank_top_k
+        self._lock = threading.Lock()
+        self._latencies = {stage: deque(maxlen=1000) for stage in self.STAGES}
+
+    def _record(self, stage, start):
+        with self._lock:
+            self._latencies[stage].append((time.perf_counter() - start) * 1000)
+
+    def retrieve(self, query, query_vector, product_category, top_k):
+        """Returns the top_k fused (and reranked, if enabled) matches."""
+        return self.retrieve_many([query], [query_vector], product_category, top_k)[0]
+
+    def retrieve_many(self, queries, query_vectors, product_category, top_k):
+        """
+        retrieve() for a batch of queries about the same product. The vector
+        search goes to the product's shard only (one batched call for LocalIndex)
+        and reranking is one cross-encoder call for the whole batch.
+        """
+        start = time.perf_counter()
+        vector_results = self.index.query_product_many(product_category, query_vectors, self.vector_top_k, True)
+        self._record("vector", start)
+
+        start = time.perf_counter()
+        keyword_results = [self.keyword_index.search(query, product_category, self.keyword_top_k)
+                           for query in queries]
+        self._record("keyword", start)
+
+        start = time.perf_counter()
+        candidate_count = self.rerank_top_k if self.reranker else top_k
+        fused = [reciprocal_rank_fusion([vector_result['matches'], keyword_matches], candidate_count)
+                 for vector_result, keyword_matches in zip(vector_results, keyword_results)]
+        self._record("fusion", start)
+
+        if self.reranker:
+            start = time.perf_counter()
+            fused = self.reranker.rerank_many(queries, fused, top_k)
+            self._record("rerank", start)
+        return [matches[:top_k] for matches in fused]
+
+    def stats(self):
+        """Returns p50/p95 latency in ms for each retrieval stage."""
+        with self._lock:
+            latencies = {stage: np.array(values) for stage, values in self._latencies.items()}
+        return {
+            stage: {
+                "count": int(values.size),
+                "p50_ms": float(np.percentile(values, 50)) if values.size else 0.0,
+                "p95_ms": float(np.percentile(values, 95)) if values.size else 0.0,
+            }
+            for stage, values in latencies.items()
+        }
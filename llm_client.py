@@ -0,0 +1,241 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import Future
+from google.api_core import exceptions as google_exceptions
+from metrics import LLM_RETRIES, LLM_COALESCED
+
+# --- Configuration ---
+# Sized to the Gemini quota: steady requests per minute plus a short burst
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "15"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "5"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+# How long a request may wait for quota before we give up and degrade
+GEMINI_MAX_WAIT_SECONDS = float(os.getenv("GEMINI_MAX_WAIT_SECONDS", "5"))
+# How often a coroutine waiting for a concurrency slot checks again
+SLOT_POLL_SECONDS = 0.01
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+
+RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+RETRYABLE_ERRORS = RATE_LIMIT_ERRORS + (google_exceptions.ServerError,)
+
+
+class LLMUnavailable(Exception):
+    """Raised when a Gemini call can't be made within our quota (or keeps failing after retries)."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `capacity`.
+    reserve() hands out a token (possibly one that hasn't refilled yet) and
+    says how long to wait for it, so both threads and coroutines can use it.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait):
+        """Takes a token and returns the seconds to wait before using it, or None if that's over max_wait."""
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def drain(self):
+        """Empties the bucket, e.g. after a 429 shows the server-side quota is used up."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter for retry number `attempt` (1-based)."""
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)) * (0.5 + random.random())
+
+
+class _GuardedStream:
+    """A streaming response that releases its concurrency slot once iterated (or closed)."""
+
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+
+    def __iter__(self):
+        try:
+            yield from self._response
+        finally:
+            self._release()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._response:
+                yield chunk
+        finally:
+            self._release()
+
+    def __getattr__(self, name):
+        # usage_metadata etc. come from the underlying response
+        return getattr(self._response, name)
+
+
+class GeminiClient:
+    """
+    Wraps genai.GenerativeModel with the same generate_content /
+    generate_content_async calls, adding:
+      - a token bucket sized to our quota and a cap on concurrent calls
+        (shared by sync and async calls),
+      - exponential backoff with jitter on 429 and 5xx errors,
+      - coalescing: identical prompts already in flight share one call.
+    Raises LLMUnavailable when quota can't be had within max_wait seconds or
+    retries run out, so callers can fall back to a degraded answer.
+    """
+
+    def __init__(self, model, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE, burst=GEMINI_BURST,
+                 max_concurrency=GEMINI_MAX_CONCURRENCY, max_retries=GEMINI_MAX_RETRIES,
+                 max_wait=GEMINI_MAX_WAIT_SECONDS):
+        self.model = model
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_async = {}
+
+    def _take_token(self):
+        wait = self.bucket.reserve(self.max_wait)
+        if wait is None:
+            raise LLMUnavailable("Gemini request budget exhausted")
+        return wait
+
+    def _on_error(self, error, attempt):
+        """Returns the backoff delay before retrying, or raises if the error shouldn't be retried."""
+        if not isinstance(error, RETRYABLE_ERRORS):
+            raise error
+        rate_limited = isinstance(error, RATE_LIMIT_ERRORS)
+        if rate_limited:
+            self.bucket.drain()
+        if attempt > self.max_retries:
+            raise LLMUnavailable(f"Gemini call failed after {self.max_retries} retries: {error}") from error
+        LLM_RETRIES.inc(reason="rate_limit" if rate_limited else "server_error")
+        delay = backoff_delay(attempt)
+        print(f"--> Gemini call failed ({type(error).__name__}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    # --- Sync ---
+
+    def _call(self, prompt, **kwargs):
+        """One call with rate limiting and retries. For streams, the slot is held until iteration ends."""
+        stream = kwargs.get("stream", False)
+        for attempt in range(1, self.max_retries + 2):
+            time.sleep(self._take_token())
+            if not self._slots.acquire(timeout=self.max_wait):
+                raise LLMUnavailable("Too many Gemini calls in flight")
+            try:
+                response = self.model.generate_content(prompt, **kwargs)
+            except Exception as e:
+                self._slots.release()
+                delay = self._on_error(e, attempt)
+            else:
+                if stream:
+                    return _GuardedStream(response, self._slots.release)
+                self._slots.release()
+                return response
+            time.sleep(delay)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._call(prompt, stream=True, **kwargs)
+        with self._lock:
+            future = self._in_flight.get(prompt)
+            leader = future is None
+            if leader:
+                future = self._in_flight[prompt] = Future()
+        if not leader:
+            LLM_COALESCED.inc()
+            return future.result()
+        try:
+            response = self._call(prompt, **kwargs)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[prompt]
+
+    # --- Async ---
+
+    async def _acquire_slot_async(self):
+        """Takes a concurrency slot (the same ones sync calls use) without blocking the event loop."""
+        deadline = time.monotonic() + self.max_wait
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise LLMUnavailable("Too many Gemini calls in flight")
+            await asyncio.sleep(SLOT_POLL_SECONDS)
+
+    async def _call_async(self, prompt, **kwargs):
+        stream = kwargs.get("stream", False)
+        for attempt in range(1, self.max_retries + 2):
+            await asyncio.sleep(self._take_token())
+            await self._acquire_slot_async()
+            try:
+                response = await self.model.generate_content_async(prompt, **kwargs)
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            except Exception as e:
+                self._slots.release()
+                delay = self._on_error(e, attempt)
+            else:
+                if stream:
+                    return _GuardedStream(response, self._slots.release)
+                self._slots.release()
+                return response
+            await asyncio.sleep(delay)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            return await self._call_async(prompt, stream=True, **kwargs)
+        while True:
+            future = self._in_flight_async.get(prompt)
+            if future is None:
+                break
+            LLM_COALESCED.inc()
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this request was cancelled, not the call it was waiting on
+                # The leader was cancelled (e.g. its client disconnected): take over the call
+
+        future = self._in_flight_async[prompt] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self._call_async(prompt, **kwargs)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved, in case nobody else was waiting
+            raise
+        finally:
+            if not future.done():
+                future.cancel()  # the leader was cancelled; a follower takes over
+            del self._in_flight_async[prompt]
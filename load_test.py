@@ -0,0 +1,125 @@
+import time
+import asyncio
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from answer_cache import AnswerCache
+from rag_pipeline import RAGPipeline, AsyncRAGPipeline
+
+# Load test for the sync vs. async pipeline, run entirely in-process against
+# stubbed Gemini/Pinecone/embedding clients with fixed latencies, so the
+# numbers reflect how each serving mode overlaps waiting, not network noise.
+# Both runs have the same number of requests in flight (--concurrency) unless
+# --sync-workers gives the sync run a different thread count.
+#
+#   python load_test.py --requests 200 --concurrency 32
+
+
+# --- 1. Stub clients ---
+
+class StubEmbeddingModel:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def encode(self, text):
+        time.sleep(self.latency)
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).random(384, dtype=np.float32)
+
+
+class StubIndex:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def query_product(self, product, vector, top_k=5, include_metadata=True):
+        time.sleep(self.latency)
+        return {"matches": [{"id": f"stub-{i}", "score": 1.0, "metadata": {"text": f"Stub passage {i}."}}
+                            for i in range(top_k)]}
+
+    def query_product_many(self, product, vectors, top_k=5, include_metadata=True):
+        return [self.query_product(product, vector, top_k, include_metadata) for vector in vectors]
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubGeminiModel:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, prompt, stream=False):
+        time.sleep(self.latency)
+        return StubResponse("Stub answer.")
+
+    async def generate_content_async(self, prompt, stream=False):
+        await asyncio.sleep(self.latency)
+        return StubResponse("Stub answer.")
+
+
+class StubClassifier:
+    def classify(self, query_vector):
+        return "washing_machine"
+
+    def scores(self, query_vector):
+        return {"washing_machine": 1.0}
+
+
+def build_clients(args):
+    return (StubEmbeddingModel(args.embed_ms / 1000), StubIndex(args.retrieval_ms / 1000),
+            StubGeminiModel(args.llm_ms / 1000), StubClassifier(), AnswerCache(max_entries=0))
+
+
+# --- 2. Runners ---
+
+def run_sync(args, queries):
+    """Sync pipeline on a fixed pool of worker threads, like a threaded WSGI server."""
+    pipeline = RAGPipeline(*build_clients(args))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sync_workers) as workers:
+        list(workers.map(pipeline.get_answer, queries))
+    return time.perf_counter() - start
+
+
+def run_async(args, queries):
+    """Async pipeline with --concurrency requests in flight on one event loop."""
+    pipeline = AsyncRAGPipeline(*build_clients(args))
+
+    async def main():
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(query):
+            async with semaphore:
+                return await pipeline.get_answer_async(query)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(query) for query in queries))
+        return time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+# --- 3. SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare sync and async pipeline throughput with stubbed clients.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight in both runs.")
+    parser.add_argument("--sync-workers", type=int, default=None,
+                        help="Worker threads for the sync run (default: --concurrency).")
+    parser.add_argument("--embed-ms", type=float, default=5)
+    parser.add_argument("--retrieval-ms", type=float, default=20)
+    parser.add_argument("--llm-ms", type=float, default=400)
+    args = parser.parse_args()
+    if args.sync_workers is None:
+        args.sync_workers = args.concurrency
+
+    queries = [f"Question number {i} about my washing machine" for i in range(args.requests)]
+    print(f"{args.requests} requests, stub latencies: embed {args.embed_ms}ms, "
+          f"retrieval {args.retrieval_ms}ms, LLM {args.llm_ms}ms")
+
+    sync_seconds = run_sync(args, queries)
+    print(f"Sync  ({args.sync_workers} worker threads): {args.requests / sync_seconds:7.1f} req/s")
+    async_seconds = run_async(args, queries)
+    print(f"Async ({args.concurrency} in flight):      {args.requests / async_seconds:7.1f} req/s")
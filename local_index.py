@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from product_classifier import EMBEDDING_FILES
+from product_registry import RESIDENT_PRODUCTS
+from vector_store import normalize_rows, open_store
+
+# --- Configuration ---
+# "pinecone" queries the hosted index, "local" serves the embedding stores in-process.
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "pinecone").lower()
+# Non-resident products' shards kept loaded at once (least recently used are unloaded)
+MAX_COLD_SHARDS = int(os.getenv("LOCAL_MAX_COLD_SHARDS", "2"))
+
+
+class ShardCache:
+    """
+    One shard per product, built by load(product) (None if it has no data).
+    Resident products (see products.json) are loaded up front and stay
+    loaded; the others are loaded on first use and kept in a small LRU.
+    """
+
+    def __init__(self, load, products, resident=None, max_cold=MAX_COLD_SHARDS):
+        self._load = load
+        self.products = list(products)
+        self.resident = {}
+        self._cold = OrderedDict()
+        self._missing = set()  # products with no data, not retried
+        self._lock = threading.Lock()
+        self.max_cold = max_cold
+        self.counters = {"cold_loads": 0, "evictions": 0}
+        for product in self.products:
+            if product in (RESIDENT_PRODUCTS if resident is None else resident):
+                self.resident[product] = load(product)
+
+    def get(self, product):
+        """The product's shard, loading it if it's cold. None for unknown products or missing data."""
+        if product in self.resident:
+            return self.resident[product]
+        if product not in self.products or product in self._missing:
+            return None
+        with self._lock:
+            if product in self._cold:
+                self._cold.move_to_end(product)
+                return self._cold[product]
+            shard = self._load(product)
+            if shard is None:
+                self._missing.add(product)
+                return None
+            self._cold[product] = shard
+            self.counters["cold_loads"] += 1
+            while len(self._cold) > self.max_cold:
+                evicted, _ = self._cold.popitem(last=False)
+                self.counters["evictions"] += 1
+                print(f"Unloaded the cold shard for {evicted}")
+        return shard
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["cold_loaded"] = list(self._cold)
+        stats["resident"] = list(self.resident)
+        return stats
+
+
+class LocalIndex:
+    """
+    In-process stand-in for the Pinecone index. Each product's embeddings are
+    a memory-mapped vector store (see vector_store.py), one shard per product,
+    and results have the same shape as `pinecone.Index.query`, so callers can
+    switch backends by config.
+    """
+
+    def __init__(self, embedding_files=None, use_mmap=True, resident=None, max_cold_shards=MAX_COLD_SHARDS):
+        self.embedding_files = embedding_files or EMBEDDING_FILES
+        self.use_mmap = use_mmap
+        self.shards = ShardCache(self._load_shard, self.embedding_files, resident, max_cold_shards)
+        loaded = {product: shard for product, shard in self.shards.resident.items() if shard is not None}
+        print(f"Local index loaded: {', '.join(f'{p} ({len(s[1])})' for p, s in loaded.items()) or 'nothing'}"
+              f"; loaded on first use: {', '.join(p for p in self.embedding_files if p not in loaded) or 'none'}")
+
+    def _load_shard(self, product):
+        file_path = self.embedding_files[product]
+        store = open_store(file_path, use_mmap=self.use_mmap)
+        if store is None:
+            print(f"Warning: '{file_path}' not found. No local results for {product}.")
+            return None
+        return store, self._entries(store.metadata)
+
+    @staticmethod
+    def _entries(metadata):
+        """Builds the Pinecone-style id and metadata for each row, once at load."""
+        return [
+            {
+                "id": f"{row['product_type']}-{row['source']}-{row['chunk_id']}",
+                "metadata": {"text": row["text"], "source": row["source"], "product_type": row["product_type"]},
+            }
+            for row in metadata[["source", "chunk_id", "text", "product_type"]].to_dict("records")
+        ]
+
+    def query_product(self, product, vector, top_k=5, include_metadata=True):
+        """Returns the top_k chunks of one product's shard by cosine similarity."""
+        return self.query_product_many(product, [vector], top_k, include_metadata)[0]
+
+    def query_product_many(self, product, vectors, top_k=5, include_metadata=True):
+        """
+        query_product for a batch of vectors, scored against the shard in one
+        matrix product. Returns one result per vector.
+        """
+        return self._query_shards([self.shards.get(product)], vectors, top_k, include_metadata)
+
+    def query(self, vector, top_k=5, include_metadata=True, filter=None):
+        """Pinecone-style query, optionally filtered to one product_type (otherwise all products)."""
+        product = (filter or {}).get("product_type")
+        if isinstance(product, dict):
+            product = product.get("$eq")
+        products = self.embedding_files if product is None else [product]
+        return self._query_shards([self.shards.get(p) for p in products], [vector], top_k, include_metadata)[0]
+
+    def stats(self):
+        return self.shards.stats()
+
+    @staticmethod
+    def _query_shards(shards, vectors, top_k, include_metadata):
+        queries = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+
+        candidates = [[] for _ in range(len(queries))]
+        for shard in shards:
+            if shard is None:
+                continue
+            store, metadata = shard
+            scores = store.scores(queries)
+            k = min(top_k, scores.shape[1])
+            if k == 0:
+                continue
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for q, rows in enumerate(top):
+                candidates[q].extend((float(scores[q, i]), metadata[i]) for i in rows)
+
+        results = []
+        for query_candidates in candidates:
+            query_candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            matches = []
+            for score, entry in query_candidates[:top_k]:
+                match = {"id": entry["id"], "score": score}
+                if include_metadata:
+                    match["metadata"] = entry["metadata"]
+                matches.append(match)
+            results.append({"matches": matches})
+        return results
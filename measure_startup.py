@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import json
+import signal
+import argparse
+import subprocess
+import urllib.request
+
+# Measures cold start and per-worker memory of the web app.
+#
+#   python measure_startup.py            # gunicorn, models preloaded in the master
+#   python measure_startup.py --no-preload
+#
+# Cold start is the time from launching gunicorn until every worker's /ready
+# returns 200. Memory is read from /proc (Linux only): RSS counts shared
+# pages in full for each worker, PSS splits them between the processes that
+# share them, so PSS is what preloading is expected to reduce.
+
+
+def read_memory_kb(pid):
+    """Returns {"rss": kB, "pss": kB, "private": kB} for a process, from /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children", "r") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def wait_until_ready(url, expected_workers, timeout):
+    """Polls /ready until `expected_workers` distinct worker pids have reported ready."""
+    ready_pids = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and len(ready_pids) < expected_workers:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                ready_pids.add(json.load(response)["pid"])
+        except Exception:
+            time.sleep(0.2)
+    return len(ready_pids) >= expected_workers
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold-start time and per-worker memory.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--no-preload", action="store_true", help="Load models in each worker instead of the master.")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    env = dict(os.environ, WEB_CONCURRENCY=str(args.workers), BIND=f"127.0.0.1:{args.port}",
+               PRELOAD_MODELS="0" if args.no_preload else "1")
+
+    # Import time alone: what every test or script importing app.py pays
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app"], env=dict(env, EMBEDDING_WARMUP="0"), check=True)
+    print(f"'import app' in a fresh interpreter: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"], env=env)
+    try:
+        if not wait_until_ready(f"http://127.0.0.1:{args.port}/ready", args.workers, args.timeout):
+            sys.exit("Workers did not become ready in time.")
+        print(f"Cold start to all {args.workers} workers ready "
+              f"({'per-worker load' if args.no_preload else 'preloaded'}): {time.perf_counter() - start:.2f}s")
+
+        master = read_memory_kb(server.pid)
+        print(f"master    RSS {master['rss'] / 1024:7.1f} MB  PSS {master['pss'] / 1024:7.1f} MB")
+        for pid in worker_pids(server.pid):
+            memory = read_memory_kb(pid)
+            print(f"worker {pid}  RSS {memory['rss'] / 1024:7.1f} MB  PSS {memory['pss'] / 1024:7.1f} MB  "
+                  f"private {memory['private'] / 1024:7.1f} MB")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
@@ -0,0 +1,206 @@
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Minimal Prometheus-style metrics plus per-request timing spans. Recording a
+# value is a dict lookup and an addition under a lock, so it's cheap enough to
+# leave on in production. GET /metrics renders everything in the Prometheus
+# text format.
+
+# Latency buckets in seconds, from sub-millisecond local work to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Endpoint label for requests that matched no route (404 probes), so arbitrary
+# paths don't each create their own histogram series
+UNMATCHED_ENDPOINT = "unmatched"
+
+_registry = []
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            if bucket < len(self.buckets):
+                series[bucket] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._values.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for upper, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (repr(upper),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def render_metrics():
+    """Returns all metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+# --- The application's metrics ---
+
+REQUEST_SECONDS = Histogram("rag_request_duration_seconds", "End-to-end request latency.", ["endpoint"])
+STAGE_SECONDS = Histogram("rag_stage_duration_seconds", "Latency of each RAG pipeline stage.", ["stage"])
+CACHE_LOOKUPS = Counter("rag_answer_cache_lookups_total", "Answer cache lookups by result.", ["result"])
+CLASSIFICATIONS = Counter("rag_classifications_total", "Product classifications by method.", ["method"])
+LLM_ERRORS = Counter("rag_llm_errors_total", "Gemini call failures.", ["call", "error"])
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Gemini token usage.", ["call", "kind"])
+LLM_RETRIES = Counter("rag_llm_retries_total", "Gemini calls retried after a 429 or 5xx.", ["reason"])
+LLM_COALESCED = Counter("rag_llm_coalesced_total", "Gemini calls answered by an identical call already in flight.")
+DEGRADED_ANSWERS = Counter("rag_degraded_answers_total", "Answers served as retrieved passages because Gemini was unavailable.")
+FAQ_LOOKUPS = Counter("rag_faq_lookups_total", "Curated FAQ/issue index lookups by result.", ["result"])
+ANSWER_SECONDS = Histogram("rag_answer_duration_seconds",
+                           "End-to-end latency by where the answer came from (faq, cache, llm, degraded).", ["source"])
+
+
+# --- Per-request timing spans ---
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_spans = contextvars.ContextVar("spans", default=None)
+_request_start = contextvars.ContextVar("request_start", default=None)
+_answer_source = contextvars.ContextVar("answer_source", default=None)
+
+
+def start_request(request_id=None):
+    """Starts timing a request and returns its id (a new one unless given)."""
+    request_id = request_id or uuid.uuid4().hex[:12]
+    _request_id.set(request_id)
+    _spans.set({})
+    _request_start.set(time.perf_counter())
+    _answer_source.set(None)
+    return request_id
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def current_spans():
+    """Returns this request's stage timings so far, in seconds."""
+    return dict(_spans.get() or {})
+
+
+def set_answer_source(source):
+    """Records where this request's answer came from: "faq", "cache", "llm" or "degraded"."""
+    _answer_source.set(source)
+
+
+def current_answer_source():
+    return _answer_source.get()
+
+
+def endpoint_label(url_rule):
+    """The metrics label for a request: its route pattern, never the raw path."""
+    return url_rule.rule if url_rule is not None else UNMATCHED_ENDPOINT
+
+
+def finish_request(endpoint):
+    """Records the request's total latency and logs its spans as one JSON line."""
+    start = _request_start.get()
+    if start is None:
+        return
+    total = time.perf_counter() - start
+    REQUEST_SECONDS.observe(total, endpoint=endpoint)
+    source = _answer_source.get()
+    if source is not None:
+        ANSWER_SECONDS.observe(total, source=source)
+    spans = _spans.get() or {}
+    print(json.dumps({
+        "request_id": _request_id.get(),
+        "endpoint": endpoint,
+        "answer_source": source,
+        "total_ms": round(total * 1000, 2),
+        "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in spans.items()},
+    }))
+    _request_start.set(None)
+
+
+@contextmanager
+def span(stage):
+    """Times a block as one pipeline stage: adds it to the histogram and the request's spans."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        spans = _spans.get()
+        if spans is not None:
+            spans[stage] = spans.get(stage, 0.0) + elapsed
+
+
+def record_llm_usage(call, response):
+    """Adds a Gemini response's token counts (if it reports them) to LLM_TOKENS."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, call=call, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, call=call, kind="completion")
+
+
+def record_llm_error(call, error):
+    """Counts a failed Gemini call, separating rate-limit (429) and out-of-budget errors from the rest."""
+    from google.api_core import exceptions as google_exceptions
+    from llm_client import LLMUnavailable
+    if isinstance(error, LLMUnavailable):
+        kind = "unavailable"
+    elif isinstance(error, google_exceptions.ResourceExhausted):
+        kind = "rate_limit"
+    else:
+        kind = "other"
+    LLM_ERRORS.inc(call=call, error=kind)
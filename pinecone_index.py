@@ -0,0 +1,63 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from product_registry import PRODUCTS, PINECONE_INDEX_HOST, RESIDENT_PRODUCTS
+
+# --- Configuration ---
+# Concurrent requests for one query_product_many call (Pinecone takes one query vector per request)
+PINECONE_QUERY_WORKERS = int(os.getenv("PINECONE_QUERY_WORKERS", "8"))
+
+
+class PineconeProductIndex:
+    """
+    Routes each product's queries to its own shard in Pinecone: the product's
+    namespace, in its own index if the registry gives it an index_host. A
+    shard only holds one product, so no metadata filter is needed; products
+    without a namespace (all of them in the shipped products.json) use the
+    shared namespace and a product_type filter.
+    Same query_product/query_product_many interface as LocalIndex.
+    """
+
+    def __init__(self, client, products=None, default_host=PINECONE_INDEX_HOST, query_workers=PINECONE_QUERY_WORKERS):
+        self.client = client
+        self.products = products or PRODUCTS
+        self.default_host = default_host
+        self._indexes = {}  # host -> pinecone.Index
+        self._lock = threading.Lock()
+        # Threads are started on first use, not here
+        self._query_pool = ThreadPoolExecutor(max_workers=query_workers, thread_name_prefix="pinecone-query")
+        # Resident products' index handles are opened now rather than on their first query
+        for product in RESIDENT_PRODUCTS:
+            if product in self.products:
+                self._index_for(product)
+
+    def _index_for(self, product):
+        host = self.products[product]["index_host"] or self.default_host
+        index = self._indexes.get(host)
+        if index is None:
+            with self._lock:
+                if host not in self._indexes:
+                    self._indexes[host] = self.client.Index(host=host)
+                index = self._indexes[host]
+        return index
+
+    def query_product(self, product, vector, top_k=5, include_metadata=True):
+        """Returns the top_k matches from the product's shard."""
+        if product not in self.products:
+            return {"matches": []}
+        namespace = self.products[product]["namespace"]
+        if namespace:
+            return self._index_for(product).query(vector=vector, top_k=top_k, include_metadata=include_metadata,
+                                                  namespace=namespace)
+        return self._index_for(product).query(vector=vector, top_k=top_k, include_metadata=include_metadata,
+                                              filter={"product_type": product})
+
+    def query_product_many(self, product, vectors, top_k=5, include_metadata=True):
+        """
+        query_product for each vector. Pinecone takes one query vector per
+        request, so the requests run concurrently rather than one after another.
+        """
+        if len(vectors) <= 1:
+            return [self.query_product(product, vector, top_k, include_metadata) for vector in vectors]
+        return list(self._query_pool.map(lambda vector: self.query_product(product, vector, top_k, include_metadata),
+                                         vectors))
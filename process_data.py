@@ -1,88 +1,185 @@
 import os
 import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import pdfplumber
+from product_registry import PRODUCTS
 
-def extract_text_from_pdf(pdf_path):
-    """Opens a PDF and extracts all the text from it using pdfplumber."""
-    full_text = ""
+# --- Configuration ---
+# Large PDFs are split into page ranges of this size so one manual can use several processes
+PAGES_PER_TASK = 25
+# Marks where each source file's text starts in <product>_content.txt, so
+# create_embeddings_v2 can attribute chunks to the real source file.
+SOURCE_MARKER = "### SOURCE: "
+# Per-source extracted text and the state of each source when it was extracted
+CACHE_DIR_NAME = ".ingest_cache"
+INGEST_MANIFEST = "ingest_manifest.json"
+
+
+def extract_text_from_pdf(pdf_path, first_page=0, last_page=None):
+    """Opens a PDF and extracts the text of pages [first_page, last_page) using pdfplumber."""
+    page_texts = []
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
+            for page in pdf.pages[first_page:last_page]:
                 page_text = page.extract_text()
                 if page_text:
-                    full_text += page_text + "\n\n"
+                    page_texts.append(page_text + "\n\n")
     except Exception as e:
         print(f"Could not read {pdf_path}: {e}")
-    return full_text
+    return "".join(page_texts)
+
+def extract_text_from_txt(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read() + "\n\n"
 
-def process_product_data(raw_data_folder, processed_data_folder, product_name):
+def extract_text_from_jsonl(file_path):
+    """Converts each JSON object into "Key: value" lines, with a separator between entries."""
+    parts = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                # Each line in a .jsonl file is a separate JSON object
+                data = json.loads(line)
+                # Convert each JSON object into a clean text string
+                for key, value in data.items():
+                    parts.append(f"{key.replace('_', ' ').title()}: {value}\n")
+                parts.append("\n---\n\n") # Separator between entries
+            except json.JSONDecodeError:
+                print(f"Warning: Could not decode a line in {os.path.basename(file_path)}: {line.strip()}")
+    return "".join(parts)
+
+def run_task(task):
+    """Runs one extraction task (a whole file, or a page range of a PDF). Used by the process pool."""
+    file_path, file_ext, first_page, last_page = task
+    if file_ext == "pdf":
+        return extract_text_from_pdf(file_path, first_page, last_page)
+    if file_ext == "txt":
+        return extract_text_from_txt(file_path)
+    return extract_text_from_jsonl(file_path)
+
+def plan_tasks(file_path, file_ext):
+    """Splits a source file into extraction tasks: page ranges for PDFs, the whole file otherwise."""
+    if file_ext != "pdf":
+        return [(file_path, file_ext, 0, None)]
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            page_count = len(pdf.pages)
+    except Exception as e:
+        print(f"Could not read {file_path}: {e}")
+        return []
+    return [(file_path, file_ext, start, start + PAGES_PER_TASK)
+            for start in range(0, page_count, PAGES_PER_TASK)]
+
+def file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    with open(file_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": digest}
+
+def is_unchanged(file_path, previous):
+    """Cheap mtime/size check first; fall back to the content hash if the file was touched."""
+    if previous is None:
+        return False
+    stat = os.stat(file_path)
+    if stat.st_mtime == previous["mtime"] and stat.st_size == previous["size"]:
+        return True
+    return file_fingerprint(file_path)["sha256"] == previous["sha256"]
+
+def process_product_data(raw_data_folder, processed_data_folder, product_name, workers=None):
     """
     Extracts text from all .pdf, .jsonl, and .txt files in a raw data folder
     and saves the combined content to a single .txt file for that product.
+
+    Source files are extracted in parallel on a process pool (PDFs split into
+    page ranges), and each result is streamed straight to the output file in
+    source order, preceded by a SOURCE_MARKER line naming the source file.
+    Sources unchanged since the last run are read back from the per-source
+    cache instead of being parsed again.
     """
     print(f"--- Processing raw data for: {product_name.upper()} ---")
-    
+
     product_output_dir = os.path.join(processed_data_folder, product_name)
-    os.makedirs(product_output_dir, exist_ok=True)
-    
-    all_text_content = ""
-    file_count = 0
-    
-    for filename in os.listdir(raw_data_folder):
+    cache_dir = os.path.join(product_output_dir, CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    manifest_path = os.path.join(cache_dir, INGEST_MANIFEST)
+    previous_manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous_manifest = json.load(f)
+
+    # 1. Decide which sources need extracting and split them into tasks
+    sources = []
+    tasks = []
+    unchanged = {}  # filename -> manifest entry for sources read from the cache
+    for filename in sorted(os.listdir(raw_data_folder)):
         file_path = os.path.join(raw_data_folder, filename)
         file_ext = filename.lower().split('.')[-1]
-        
-        print(f"Processing {filename}...")
-        file_count += 1
-        
-        if file_ext == "pdf":
-            all_text_content += extract_text_from_pdf(file_path)
-            
-        elif file_ext == "txt":
-            with open(file_path, 'r', encoding='utf-8') as f:
-                all_text_content += f.read() + "\n\n"
-                
-        elif file_ext == "jsonl":
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        # Each line in a .jsonl file is a separate JSON object
-                        data = json.loads(line)
-                        # Convert each JSON object into a clean text string
-                        for key, value in data.items():
-                            all_text_content += f"{key.replace('_', ' ').title()}: {value}\n"
-                        all_text_content += "\n---\n\n" # Separator between entries
-                    except json.JSONDecodeError:
-                        print(f"Warning: Could not decode a line in {filename}: {line.strip()}")
-
-    if file_count > 0 and all_text_content.strip():
-        # Save all the extracted text into one consolidated file for the product
-        output_filename = f"{product_name}_content.txt"
-        output_path = os.path.join(product_output_dir, output_filename)
-        
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(all_text_content)
-        print(f"Successfully created '{output_path}' from {file_count} source file(s).")
+        if file_ext not in ("pdf", "txt", "jsonl"):
+            continue
+        cache_path = os.path.join(cache_dir, filename + ".txt")
+        if os.path.exists(cache_path) and is_unchanged(file_path, previous_manifest.get(filename)):
+            print(f"Unchanged, using cached text: {filename}")
+            sources.append((filename, cache_path, None))
+            # Keeps the hash from last time; a new mtime (touched, same content) is recorded
+            stat = os.stat(file_path)
+            unchanged[filename] = {**previous_manifest[filename], "mtime": stat.st_mtime, "size": stat.st_size}
+        else:
+            print(f"Processing {filename}...")
+            source_tasks = plan_tasks(file_path, file_ext)
+            sources.append((filename, cache_path, len(source_tasks)))
+            tasks.extend(source_tasks)
+
+    # 2. Extract in parallel and stream each source to the output as it completes, in order
+    output_filename = f"{product_name}_content.txt"
+    output_path = os.path.join(product_output_dir, output_filename)
+    manifest = {}
+    wrote_text = False
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(output_path + ".tmp", "w", encoding="utf-8") as output:
+        results = pool.map(run_task, tasks)
+        for filename, cache_path, task_count in sources:
+            if task_count is not None:
+                with open(cache_path, "w", encoding="utf-8") as cache:
+                    for _ in range(task_count):
+                        cache.write(next(results))
+            with open(cache_path, "r", encoding="utf-8") as cache:
+                text = cache.read()
+            if text.strip():
+                output.write(f"{SOURCE_MARKER}{filename}\n\n")
+                output.write(text)
+                wrote_text = True
+            manifest[filename] = unchanged.get(filename) or file_fingerprint(os.path.join(raw_data_folder, filename))
+
+    if wrote_text:
+        os.replace(output_path + ".tmp", output_path)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        print(f"Successfully created '{output_path}' from {len(sources)} source file(s).")
     else:
+        os.remove(output_path + ".tmp")
         print(f"No processable files (.pdf, .jsonl, .txt) found or no text extracted in '{raw_data_folder}'.")
-        
+
     print(f"Finished processing for {product_name.upper()}.\n")
 
 # --- SCRIPT EXECUTION ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract raw product documents into processed text.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Extraction processes (default: one per CPU).")
+    args = parser.parse_args()
+
     PROCESSED_TEXT_BASE_FOLDER = "processed_text"
 
-    # Map your raw data folders to the product names
-    product_map = {
-        "microwave_data": "microwave",
-        "wm_data": "washing_machine",
-        "fridge_data": "fridge"
-    }
-    
+    # Map your raw data folders to the product names (raw_folder in products.json)
+    product_map = {product["raw_folder"]: name for name, product in PRODUCTS.items() if product["raw_folder"]}
+
     for raw_folder, product_name in product_map.items():
         if os.path.exists(raw_folder):
-            process_product_data(raw_folder, PROCESSED_TEXT_BASE_FOLDER, product_name)
+            process_product_data(raw_folder, PROCESSED_TEXT_BASE_FOLDER, product_name, workers=args.workers)
         else:
             print(f"Warning: Raw data folder not found at '{raw_folder}'. Skipping {product_name}.")
-            
-    print("--- All raw data has been processed! ---")
\ No newline at end of file
+
+    print("--- All raw data has been processed! ---")
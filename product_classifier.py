@@ -0,0 +1,89 @@
+import os
+import threading
+import numpy as np
+from vector_store import open_store
+from product_registry import PRODUCTS
+
+# --- Configuration ---
+# The products come from the registry (products.json, see product_registry.py)
+PRODUCT_CATEGORIES = list(PRODUCTS)
+EMBEDDING_FILES = {name: product["embedding_file"] for name, product in PRODUCTS.items()}
+
+# A query is classified locally only when the best centroid is similar enough
+# AND clearly ahead of the runner-up. Anything else goes to the LLM.
+MIN_SCORE = float(os.getenv("CLASSIFIER_MIN_SCORE", "0.20"))
+MIN_MARGIN = float(os.getenv("CLASSIFIER_MIN_MARGIN", "0.05"))
+# A product without an embeddings store has no chunks in the local index, and
+# upload_to_pinecone.py uploads from the same stores, so by default the
+# classifier picks among the products that have data. Set this to 1 when a
+# product's vectors are in Pinecone but not on disk: then every query goes to
+# the LLM while any product is missing, since it can't be ruled out locally.
+REQUIRE_ALL_PRODUCTS = os.getenv("CLASSIFIER_REQUIRE_ALL_PRODUCTS", "0") == "1"
+
+
+class ProductClassifier:
+    """
+    Nearest-centroid product classifier built from the per-product chunk
+    embeddings, so most queries never need an LLM call to pick a category.
+    """
+
+    def __init__(self, embedding_files=None, min_score=MIN_SCORE, min_margin=MIN_MARGIN,
+                 require_all_products=REQUIRE_ALL_PRODUCTS):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.require_all_products = require_all_products
+        self.labels = []
+        centroids = []
+
+        for product, file_path in (embedding_files or EMBEDDING_FILES).items():
+            store = open_store(file_path)
+            if store is None:
+                if require_all_products:
+                    print(f"Warning: '{file_path}' not found. Every query will use the LLM fallback.")
+                else:
+                    print(f"Warning: '{file_path}' not found. {product} has no data and won't be "
+                          f"classified locally until its embeddings are built.")
+                continue
+            centroid = store.dense().mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+            self.labels.append(product)
+
+        self.centroids = np.vstack(centroids) if centroids else np.empty((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.counters = {"local": 0, "fallback": 0}
+
+    def scores(self, query_vector):
+        """Returns the cosine similarity of the query to each product centroid."""
+        if not self.labels:
+            return {}
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        similarities = self.centroids @ query
+        return dict(zip(self.labels, similarities.tolist()))
+
+    def classify(self, query_vector):
+        """
+        Returns the product category for a query vector, or None when the match
+        is too weak or too close to call and the caller should ask the LLM.
+        """
+        ranked = sorted(self.scores(query_vector).items(), key=lambda item: item[1], reverse=True)
+        confident = False
+        if ranked:
+            best_score = ranked[0][1]
+            runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+            confident = best_score >= self.min_score and best_score - runner_up >= self.min_margin
+            if self.require_all_products:
+                # A product missing locally may still be in Pinecone, so it can't be ruled out
+                confident = confident and len(self.labels) == len(PRODUCT_CATEGORIES)
+
+        with self._lock:
+            self.counters["local" if confident else "fallback"] += 1
+        return ranked[0][0] if confident else None
+
+    def stats(self):
+        """Returns how many queries were classified locally vs. sent to the LLM."""
+        with self._lock:
+            counters = dict(self.counters)
+        total = counters["local"] + counters["fallback"]
+        counters["fallback_rate"] = counters["fallback"] / total if total else 0.0
+        return counters
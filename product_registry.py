@@ -0,0 +1,78 @@
+import os
+import json
+
+# The supported products and where each one's data lives, read from
+# products.json (or the file named by PRODUCT_REGISTRY). Adding an appliance
+# is one entry there; the ingestion scripts, the index and the prompts all
+# read it from here. Each product entry has:
+#
+#   name              category id used everywhere (required)
+#   label             plural for messages to the user ("washing machines")
+#   namespace         its Pinecone namespace; null = the shared namespace
+#                     with a product_type metadata filter (the old layout,
+#                     and the default). To move a product into its own
+#                     namespace, set it here and run
+#                     `upload_to_pinecone.py --sync` before deploying the
+#                     server with the new registry: until then its queries
+#                     go to an empty namespace. The sync also deletes the
+#                     product's old copies from the shared namespace.
+#   index_host        its own Pinecone index (default: pinecone.index_host)
+#   raw_folder        raw documents, for process_data.py
+#   data_folder       processed text (default processed_text/<name>)
+#   embedding_file    embeddings file (default <name>_embeddings.parquet)
+#   issues, faqs      curated Q&A sources for the FAQ index (optional)
+#   resident          keep its local shards loaded from startup; otherwise
+#                     they're loaded on first use
+#   prompt_template   answer prompt with {product_category}, {context} and
+#                     {query} placeholders (default: rag_pipeline's)
+
+# --- Configuration ---
+PRODUCT_REGISTRY_PATH = os.getenv("PRODUCT_REGISTRY",
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.json"))
+
+
+def _with_defaults(entry):
+    name = entry["name"]
+    return {
+        "label": name.replace("_", " ") + "s",
+        "namespace": None,
+        "index_host": None,
+        "raw_folder": None,
+        "data_folder": f"processed_text/{name}",
+        "embedding_file": f"{name}_embeddings.parquet",
+        "issues": None,
+        "faqs": None,
+        "resident": True,
+        "prompt_template": None,
+        **entry,
+    }
+
+
+def load_registry(path=PRODUCT_REGISTRY_PATH):
+    """Returns ({"index_name", "index_host"} Pinecone settings, {name: product entry}) from the registry file."""
+    with open(path, "r", encoding="utf-8") as f:
+        registry = json.load(f)
+    products = {}
+    for entry in registry.get("products", []):
+        if not entry.get("name"):
+            raise ValueError(f"{path}: every product needs a \"name\"")
+        if entry["name"] in products:
+            raise ValueError(f"{path}: product '{entry['name']}' is listed twice")
+        products[entry["name"]] = _with_defaults(entry)
+    if not products:
+        raise ValueError(f"{path}: no products configured")
+    return registry.get("pinecone", {}), products
+
+
+PINECONE_SETTINGS, PRODUCTS = load_registry()
+PINECONE_INDEX_NAME = PINECONE_SETTINGS.get("index_name")
+PINECONE_INDEX_HOST = PINECONE_SETTINGS.get("index_host")
+RESIDENT_PRODUCTS = [name for name, product in PRODUCTS.items() if product["resident"]]
+
+
+def product_list_text(conjunction="or"):
+    """The products' labels as a phrase for the user: "microwaves, washing machines, or fridges"."""
+    labels = [product["label"] for product in PRODUCTS.values()]
+    if len(labels) == 1:
+        return labels[0]
+    return f"{', '.join(labels[:-1])}, {conjunction} {labels[-1]}"
@@ -0,0 +1,686 @@
+import os
+import json
+import time
+import asyncio
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from functools import partial
+from google.api_core import exceptions as google_exceptions
+from product_classifier import PRODUCT_CATEGORIES
+from product_registry import PRODUCTS, product_list_text
+from context_assembler import assemble_context, estimate_tokens
+from llm_client import LLMUnavailable
+import metrics
+from metrics import span, CACHE_LOOKUPS, CLASSIFICATIONS, DEGRADED_ANSWERS, record_llm_error, record_llm_usage
+
+# --- Configuration ---
+TOP_K = 5
+# Threads for the CPU-bound embedding_model.encode calls (async mode)
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Threads for blocking index queries (the Pinecone client is synchronous)
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "16"))
+# When the local classifier is unsure, retrieve for this many top-ranked products
+# while the LLM decides, so the retrieval isn't waiting on the classification call.
+SPECULATIVE_PRODUCTS = 2
+# Passages shown to the user when Gemini is unavailable
+DEGRADED_PASSAGES = 3
+# Batch answering (/ask/batch, ask_bot.py --batch): generation calls in parallel, and batch size limit
+BATCH_GENERATION_WORKERS = int(os.getenv("BATCH_GENERATION_WORKERS", "8"))
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+# Follow-up questions in a session: fresh chunks retrieved, and the weight
+# on the previous turn's chunks carried into the context alongside them
+FOLLOW_UP_TOP_K = 3
+PRIOR_CONTEXT_WEIGHT = 0.9
+
+
+# Products can override this in products.json ("prompt_template")
+ANSWER_PROMPT_TEMPLATE = """
+    You are a helpful AI assistant for troubleshooting {product_category} issues.
+    Answer the user's question based ONLY on the following context.
+    If the context doesn't contain enough information, say "I don't have enough information in my documents to answer that."
+    CONTEXT:
+    {context}
+    USER'S QUESTION:
+    {query}
+    ANSWER:
+    """
+
+
+def build_classification_prompt(query):
+    return f"""
+    Based on the user's question, identify which of the following product categories it belongs to:
+    {', '.join(PRODUCT_CATEGORIES)}.
+    Return only the single category name and nothing else.
+    Question: "{query}"
+    Category:
+    """
+
+
+def build_answer_prompt(query, product_category, context):
+    template = PRODUCTS[product_category]["prompt_template"] or ANSWER_PROMPT_TEMPLATE
+    return template.format(product_category=product_category, context=context, query=query)
+
+
+def parse_classification(classification_text):
+    """Returns (category, None), or (None, message for the user) if the LLM's reply isn't a category."""
+    product_category = classification_text.strip().lower()
+    if product_category not in PRODUCT_CATEGORIES:
+        return None, f"I can only answer questions about {product_list_text()}. Please be more specific."
+    return product_category, None
+
+
+def classification_error_message(error):
+    """Maps an exception from the classification call to a message for the user."""
+    if isinstance(error, google_exceptions.ResourceExhausted):
+        print(f"RATE LIMIT ERROR: {error}")
+        return "Sorry, I've hit my daily usage limit for the API. Please try again tomorrow or upgrade to a paid plan."
+    print(f"Error in classification: {error}")
+    return "I had trouble understanding which product you're asking about. Please rephrase."
+
+
+def parse_batch_queries(lines):
+    """
+    Parses JSONL batch input: one {"query": ...} object per line (an "issue"
+    field, as in our *_issues.jsonl files, also works) with an optional "id".
+    Returns [{"id", "query"}]; raises ValueError on a malformed line.
+    """
+    items = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}")
+        query = record.get("query") or record.get("issue") if isinstance(record, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError(f"Line {number} has no \"query\"")
+        items.append({"id": record.get("id", len(items)), "query": query})
+    if len(items) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries per batch")
+    return items
+
+
+def batch_result_line(items, result):
+    """One JSONL output line for an answer_batch result, labelled with the input item's id."""
+    return json.dumps({"id": items[result["index"]]["id"], **result}) + "\n"
+
+
+def session_matches(matches):
+    """Plain-dict copies of retrieved matches (id, score, text and source) to keep in a session."""
+    return [{"id": match["id"], "score": match.get("score", 0.0),
+             "metadata": {key: match["metadata"][key] for key in ("text", "source", "product_type")
+                          if key in match["metadata"]}}
+            for match in matches]
+
+
+def extend_context(matches, prior_matches):
+    """
+    The fresh matches for a follow-up question plus the previous turn's chunks
+    that weren't retrieved again, with their scores scaled by PRIOR_CONTEXT_WEIGHT
+    (so each turn they aren't re-retrieved, older chunks rank lower).
+    """
+    seen = {match["id"] for match in matches}
+    carried = [{**match, "score": match["score"] * PRIOR_CONTEXT_WEIGHT}
+               for match in prior_matches if match["id"] not in seen]
+    return session_matches(matches) + carried
+
+
+def build_degraded_answer(product_category, matches):
+    """The answer when Gemini is out of budget: the top retrieved passages, verbatim."""
+    DEGRADED_ANSWERS.inc()
+    metrics.set_answer_source("degraded")
+    top = sorted(matches, key=lambda match: match.get("score", 0.0), reverse=True)[:DEGRADED_PASSAGES]
+    passages = "\n\n".join(f"- {' '.join(match['metadata']['text'].split())}" for match in top)
+    return (f"I'm getting a lot of questions right now and can't write a full answer, but these "
+            f"sections of the {product_category} documents look relevant:\n\n{passages}")
+
+
+class RAGPipeline:
+    """
+    The main logic for the RAG system: cache lookup, embedding, product
+    classification, retrieval and generation. All clients are passed in so
+    the same pipeline runs against Pinecone/Gemini or local stand-ins.
+    """
+
+    def __init__(self, embedding_model, index, gemini_model, product_classifier, answer_cache, top_k=TOP_K,
+                 retriever=None, session_store=None, faq_index=None):
+        self.embedding_model = embedding_model
+        self.index = index
+        # Optional HybridRetriever; without it retrieval is a plain vector query
+        self.retriever = retriever
+        self.gemini_model = gemini_model
+        self.product_classifier = product_classifier
+        self.answer_cache = answer_cache
+        self.top_k = top_k
+        # Optional SessionStore for follow-up questions (see session_store.py)
+        self.session_store = session_store
+        # Optional FaqIndex of curated answers served without the LLM (see faq_index.py)
+        self.faq_index = faq_index
+
+    def _best_local_guess(self, query_vector, error):
+        """Falls back to the local classifier's top-scoring product when Gemini is unavailable."""
+        scores = self.product_classifier.scores(query_vector)
+        if not scores:
+            return None, classification_error_message(error)
+        print("--> Gemini unavailable; using the local classifier's best guess")
+        return max(scores, key=scores.get), None
+
+    def classify_with_llm(self, query, query_vector):
+        """
+        Asks Gemini for the product category. Only used when the local classifier
+        is unsure. Returns (category, None), or (None, message for the user) on failure.
+        """
+        CLASSIFICATIONS.inc(method="llm")
+        try:
+            with span("classify_llm"):
+                classification_response = self.gemini_model.generate_content(build_classification_prompt(query))
+        except LLMUnavailable as e:
+            record_llm_error("classify", e)
+            return self._best_local_guess(query_vector, e)
+        except Exception as e:
+            record_llm_error("classify", e)
+            return None, classification_error_message(e)
+        record_llm_usage("classify", classification_response)
+        return parse_classification(classification_response.text)
+
+    def retrieve(self, query, query_vector, product_category, top_k=None):
+        """Returns the top matches for the query within one product's documents."""
+        top_k = top_k or self.top_k
+        with span("retrieve"):
+            if self.retriever is not None:
+                return self.retriever.retrieve(query, query_vector, product_category, top_k)
+            # The index picks the product's data: its local store, its Pinecone namespace, or (namespace
+            # null in products.json, as shipped) the shared namespace with a product_type filter
+            search_results = self.index.query_product(product_category, query_vector, top_k, include_metadata=True)
+            return search_results['matches']
+
+    def retrieve_many(self, queries, query_vectors, product_category):
+        """retrieve() for several queries about one product, batched where the backends allow it."""
+        with span("retrieve"):
+            if self.retriever is not None:
+                return self.retriever.retrieve_many(queries, query_vectors, product_category, self.top_k)
+            results = self.index.query_product_many(product_category, query_vectors, self.top_k, True)
+            return [result['matches'] for result in results]
+
+    def _finish_plan(self, query, query_vector, product_category, matches):
+        """Builds the context and prompt from retrieved matches (steps 4-5)."""
+        if not matches:
+            return {"answer": f"I couldn't find any specific information about that in my {product_category} documents."}
+
+        # Drop overlapping/duplicate passages and fit the context to the token budget
+        with span("assemble_context"):
+            context, context_stats = assemble_context(matches)
+            prompt = build_answer_prompt(query, product_category, context)
+        print(f"--> Context: {context_stats['used']} of {context_stats['retrieved']} passages, "
+              f"~{context_stats['context_tokens']} tokens (retrieved ~{context_stats['retrieved_tokens']}), "
+              f"prompt ~{estimate_tokens(prompt)} tokens")
+        return {"prompt": prompt, "query_vector": query_vector, "product_category": product_category,
+                "matches": matches}
+
+    def _get_session(self, session_id):
+        """The session's product and previous chunks, or None (no session id, store, or expired)."""
+        if self.session_store is None or not session_id:
+            return None
+        return self.session_store.get(session_id)
+
+    def _session_product(self, session):
+        """Used when the local classifier is unsure: the product the session is already about, if any."""
+        if session is None or session["product_category"] is None:
+            return None
+        CLASSIFICATIONS.inc(method="session")
+        print("--> Follow-up question; using the session's product")
+        return session["product_category"]
+
+    def _remember(self, session_id, plan):
+        """Stores the product and chunks behind this turn's answer in the session."""
+        if self.session_store is None or not session_id or plan.get("product_category") is None:
+            return
+        matches = plan.get("matches")
+        self.session_store.update(session_id, plan["product_category"],
+                                  session_matches(matches) if matches else None)
+
+    def _cache_answer(self, query, answer, plan):
+        # Answers built on a previous turn's context depend on the conversation, so only
+        # answers to standalone questions are cached
+        if not plan.get("follow_up"):
+            self.answer_cache.put(query, answer, plan["query_vector"], plan["product_category"],
+                                  session_matches(plan["matches"]))
+
+    def _faq_answer(self, query_vector, product_category=None):
+        """
+        The zero-LLM fast path: a curated answer if the query matches a known
+        question (about product_category, if given), else None.
+        """
+        if self.faq_index is None:
+            return None
+        entry = self.faq_index.match(query_vector, product_category)
+        if entry is None:
+            return None
+        metrics.set_answer_source("faq")
+        print(f"--> Answered from the FAQ index ({entry['score']:.3f}): {entry['question']}")
+        return {"answer": entry["answer"], "product_category": entry["product_type"]}
+
+    def _faq_then_classify(self, query_vector, session):
+        """
+        The FAQ fast path and the local classifier. Mid-conversation the
+        classifier runs first and only curated answers about the product in
+        question (the classified one, else the session's) are considered, so a
+        follow-up can't be answered about, and switch the session to, another
+        product. Returns (FAQ plan or None, locally classified product or None).
+        """
+        if session is None or session["product_category"] is None:
+            faq_plan = self._faq_answer(query_vector)
+            return faq_plan, (self._classify_locally(query_vector) if faq_plan is None else None)
+        product_category = self._classify_locally(query_vector)
+        return self._faq_answer(query_vector, product_category or session["product_category"]), product_category
+
+    def _cached_exact(self, query):
+        """A plan with the cached answer (and its product and chunks, for the session), or None."""
+        with span("cache_lookup"):
+            cached = self.answer_cache.get(query)
+        if cached is not None:
+            metrics.set_answer_source("cache")
+            CACHE_LOOKUPS.inc(result="exact_hit")
+            print("--> Served from cache (exact match)")
+        return cached
+
+    def _cached_similar(self, query_vector, product_category):
+        with span("cache_lookup"):
+            cached = self.answer_cache.get_similar(query_vector, product_category)
+        if cached is not None:
+            metrics.set_answer_source("cache")
+            CACHE_LOOKUPS.inc(result="semantic_hit")
+            print("--> Served from cache (similar question)")
+        else:
+            CACHE_LOOKUPS.inc(result="miss")
+        return cached
+
+    def _classify_locally(self, query_vector):
+        with span("classify"):
+            product_category = self.product_classifier.classify(query_vector)
+        if product_category is not None:
+            CLASSIFICATIONS.inc(method="local")
+        return product_category
+
+    def prepare_answer(self, query, session=None):
+        """
+        Runs every step of the pipeline up to generation.
+        Returns {"answer": ...} when no generation is needed (cache hit or error),
+        otherwise {"prompt": ...} plus what's needed to cache the generated answer.
+        With a session (from SessionStore.get) that already has a product, the
+        question is treated as a follow-up: the LLM classifier is skipped and
+        the previous turn's chunks are extended rather than retrieved afresh.
+        """
+        in_session = session is not None and session["product_category"] is not None
+
+        # --- Step 0: Return a cached answer for a repeated question ---
+        # (not mid-conversation, where the same words can refer to the earlier turns)
+        if not in_session:
+            cached = self._cached_exact(query)
+            if cached is not None:
+                return cached
+
+        # --- Step 1: Create a query vector ---
+        with span("embed"):
+            query_vector = self.embedding_model.encode(query).tolist()
+
+        # A curated FAQ/issue answer for a known question needs no retrieval or LLM
+        faq_plan, product_category = self._faq_then_classify(query_vector, session)
+        if faq_plan is not None:
+            return faq_plan
+
+        # --- Step 2: Classify the product category ---
+        product_category = product_category or self._session_product(session)
+        if product_category is None:
+            product_category, error_message = self.classify_with_llm(query, query_vector)
+            if error_message:
+                return {"answer": error_message}
+
+        print(f"--> Detected product: {product_category}")
+
+        # --- Steps 3-5: Search the index, build the context and prompt ---
+        if in_session and product_category == session["product_category"]:
+            # Follow-up: a few fresh chunks on top of the ones the last answer used
+            matches = extend_context(self.retrieve(query, query_vector, product_category, FOLLOW_UP_TOP_K),
+                                     session["matches"])
+            return {**self._finish_plan(query, query_vector, product_category, matches), "follow_up": True}
+
+        # A near-duplicate of a cached question about the same product reuses its answer
+        cached = self._cached_similar(query_vector, product_category)
+        if cached is not None:
+            return cached
+
+        matches = self.retrieve(query, query_vector, product_category)
+        return self._finish_plan(query, query_vector, product_category, matches)
+
+    def get_answer(self, query, session_id=None):
+        """
+        Answers a query end to end and returns the answer text. Pass a session_id
+        to answer it as part of a conversation (see prepare_answer).
+        """
+        plan = self.prepare_answer(query, self._get_session(session_id))
+        self._remember(session_id, plan)
+        if "answer" in plan:
+            return plan["answer"]
+        return self._generate(query, plan)
+
+    def _generate(self, query, plan):
+        # --- Step 6: Generate the final answer ---
+        try:
+            with span("generate"):
+                final_response = self.gemini_model.generate_content(plan["prompt"])
+        except LLMUnavailable as e:
+            record_llm_error("generate", e)
+            return build_degraded_answer(plan["product_category"], plan["matches"])
+        except Exception as e:
+            record_llm_error("generate", e)
+            raise
+        record_llm_usage("generate", final_response)
+        metrics.set_answer_source("llm")
+        self._cache_answer(query, final_response.text, plan)
+        return final_response.text
+
+    def stream_answer(self, query, session_id=None):
+        """
+        Same as get_answer, but yields the answer text piece by piece as Gemini
+        produces it instead of waiting for the full completion.
+        """
+        plan = self.prepare_answer(query, self._get_session(session_id))
+        self._remember(session_id, plan)
+        if "answer" in plan:
+            yield plan["answer"]
+            return
+
+        answer_parts = []
+        try:
+            with span("generate"):
+                response = self.gemini_model.generate_content(plan["prompt"], stream=True)
+                for chunk in response:
+                    if chunk.text:
+                        answer_parts.append(chunk.text)
+                        yield chunk.text
+        except LLMUnavailable as e:
+            # Raised before the stream starts, so nothing has been sent yet
+            record_llm_error("generate", e)
+            yield build_degraded_answer(plan["product_category"], plan["matches"])
+            return
+        except Exception as e:
+            record_llm_error("generate", e)
+            raise
+        record_llm_usage("generate", response)
+        metrics.set_answer_source("llm")
+        self._cache_answer(query, "".join(answer_parts), plan)
+
+
+    def answer_batch(self, queries, max_workers=BATCH_GENERATION_WORKERS):
+        """
+        Answers many queries at once, yielding one result dict per query in
+        completion order: {"index", "query", "answer", "elapsed_ms", "timings_ms"}
+        (plus "error" if it failed). Batch queries don't use sessions. All queries are embedded in one encode
+        call and retrieved per product in bulk; LLM classification, retrieval
+        and generation run on up to max_workers threads. A failure only
+        affects the items it belongs to, which get an "error" result.
+        """
+        batch_start = time.perf_counter()
+        items = [{"index": i, "query": query, "context": contextvars.copy_context()}
+                 for i, query in enumerate(queries)]
+
+        def result(item, answer, error=None):
+            timings = item["context"].run(metrics.current_spans)
+            timings.update(item.get("shared", {}))
+            output = {"index": item["index"], "query": item["query"], "answer": answer,
+                      "elapsed_ms": round((time.perf_counter() - batch_start) * 1000, 2),
+                      "timings_ms": {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}}
+            if error is not None:
+                output["error"] = error
+            return output
+
+        # Each query gets its own timing context, so the pipeline's spans are per item
+        pending = []
+        for item in items:
+            item["context"].run(metrics.start_request)
+            cached = item["context"].run(self._cached_exact, item["query"])
+            if cached is not None:
+                yield result(item, cached["answer"])
+            else:
+                pending.append(item)
+        if not pending:
+            return
+
+        failure_answer = "Sorry, something went wrong. Please try again."
+
+        # --- One encode call for the whole batch ---
+        start = time.perf_counter()
+        try:
+            vectors = self.embedding_model.encode([item["query"] for item in pending])
+        except Exception as e:
+            print(f"Error embedding {len(pending)} batch items: {e}")
+            for item in pending:
+                yield result(item, failure_answer, error=str(e))
+            return
+        embed_seconds = time.perf_counter() - start
+        remaining = []
+        for item, vector in zip(pending, vectors):
+            item["vector"] = vector.tolist()
+            item["shared"] = {"batch_embed": embed_seconds}
+            faq_plan = item["context"].run(self._faq_answer, item["vector"])
+            if faq_plan is not None:
+                yield result(item, faq_plan["answer"])
+                continue
+            item["product"] = item["context"].run(self._classify_locally, item["vector"])
+            remaining.append(item)
+        pending = remaining
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch") as pool:
+            # --- LLM classification for the queries the local classifier is unsure about ---
+            unsure = {pool.submit(item["context"].run, self.classify_with_llm, item["query"], item["vector"]): item
+                      for item in pending if item["product"] is None}
+            for future in as_completed(unsure):
+                item = unsure[future]
+                try:
+                    item["product"], error_message = future.result()
+                except Exception as e:
+                    print(f"Error classifying batch item {item['index']}: {e}")
+                    pending.remove(item)
+                    yield result(item, failure_answer, error=str(e))
+                    continue
+                if error_message:
+                    pending.remove(item)
+                    yield result(item, error_message)
+
+            ready = []
+            for item in pending:
+                cached = item["context"].run(self._cached_similar, item["vector"], item["product"])
+                if cached is not None:
+                    yield result(item, cached["answer"])
+                else:
+                    ready.append(item)
+
+            # --- Bulk retrieval (one job per product) and generation, on the pool ---
+            # Each product's generation starts as soon as its retrieval is done,
+            # and results are yielded in completion order.
+            by_product = {}
+            for item in ready:
+                by_product.setdefault(item["product"], []).append(item)
+            jobs = {pool.submit(self._retrieve_group, product, group): ("retrieve", group)
+                    for product, group in by_product.items()}
+            while jobs:
+                done, _ = wait(jobs, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, payload = jobs.pop(future)
+                    if stage == "retrieve":
+                        try:
+                            future.result()
+                        except Exception as e:
+                            print(f"Error retrieving for {len(payload)} batch items ({payload[0]['product']}): {e}")
+                            for item in payload:
+                                yield result(item, failure_answer, error=str(e))
+                            continue
+                        for item in payload:
+                            jobs[pool.submit(item["context"].run, self._answer_prepared, item)] = ("generate", item)
+                        continue
+                    try:
+                        yield result(payload, future.result())
+                    except Exception as e:
+                        print(f"Error answering batch item {payload['index']}: {e}")
+                        yield result(payload, failure_answer, error=str(e))
+
+    def _retrieve_group(self, product, group):
+        """Retrieves for a batch's items about one product in one bulk call; sets each item's matches."""
+        start = time.perf_counter()
+        match_lists = self.retrieve_many([item["query"] for item in group], [item["vector"] for item in group],
+                                         product)
+        retrieve_seconds = time.perf_counter() - start
+        for item, matches in zip(group, match_lists):
+            item["matches"] = matches
+            item["shared"]["batch_retrieve"] = retrieve_seconds
+
+    def _answer_prepared(self, item):
+        """Context assembly and generation for one batch item whose matches are already retrieved."""
+        plan = self._finish_plan(item["query"], item["vector"], item["product"], item["matches"])
+        if "answer" in plan:
+            return plan["answer"]
+        return self._generate(item["query"], plan)
+
+
+class AsyncRAGPipeline(RAGPipeline):
+    """
+    asyncio version of RAGPipeline for the ASGI server. Gemini calls are awaited
+    natively, embedding runs on a small bounded executor (it's CPU-bound) and
+    index queries run on a separate I/O executor, so one slow LLM call never
+    holds a worker while other requests wait.
+    """
+
+    def __init__(self, *args, embedding_workers=EMBEDDING_WORKERS, retrieval_workers=RETRIEVAL_WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.embedding_executor = ThreadPoolExecutor(max_workers=embedding_workers, thread_name_prefix="embed")
+        self.retrieval_executor = ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="retrieve")
+
+    async def _run_in(self, executor, func, *args, **kwargs):
+        # Copy the context so timing spans recorded in the worker thread land on this request
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, context.run, partial(func, *args, **kwargs))
+
+    async def encode_async(self, query):
+        with span("embed"):
+            if hasattr(self.embedding_model, "submit"):
+                # A BatchingEmbedder already runs encode on its own thread
+                vector = await asyncio.wrap_future(self.embedding_model.submit(query))
+            else:
+                vector = await self._run_in(self.embedding_executor, self.embedding_model.encode, query)
+        return vector.tolist()
+
+    async def retrieve_async(self, query, query_vector, product_category, top_k=None):
+        return await self._run_in(self.retrieval_executor, self.retrieve, query, query_vector, product_category,
+                                  top_k)
+
+    async def classify_with_llm_async(self, query, query_vector):
+        CLASSIFICATIONS.inc(method="llm")
+        try:
+            with span("classify_llm"):
+                classification_response = await self.gemini_model.generate_content_async(
+                    build_classification_prompt(query))
+        except LLMUnavailable as e:
+            record_llm_error("classify", e)
+            return self._best_local_guess(query_vector, e)
+        except Exception as e:
+            record_llm_error("classify", e)
+            return None, classification_error_message(e)
+        record_llm_usage("classify", classification_response)
+        return parse_classification(classification_response.text)
+
+    async def prepare_answer_async(self, query, session=None):
+        """Async prepare_answer. Same arguments and return values."""
+        in_session = session is not None and session["product_category"] is not None
+        if not in_session:
+            cached = self._cached_exact(query)
+            if cached is not None:
+                return cached
+
+        query_vector = await self.encode_async(query)
+
+        faq_plan, product_category = self._faq_then_classify(query_vector, session)
+        if faq_plan is not None:
+            return faq_plan
+
+        product_category = product_category or self._session_product(session)
+        speculative = {}
+        if product_category is None:
+            # Retrieve for the most likely products while the LLM classifies
+            ranked = sorted(self.product_classifier.scores(query_vector).items(),
+                            key=lambda item: item[1], reverse=True)
+            candidates = [product for product, _ in ranked[:SPECULATIVE_PRODUCTS]]
+            results = await asyncio.gather(
+                self.classify_with_llm_async(query, query_vector),
+                *(self.retrieve_async(query, query_vector, product) for product in candidates)
+            )
+            (product_category, error_message), retrieved = results[0], results[1:]
+            if error_message:
+                return {"answer": error_message}
+            speculative = dict(zip(candidates, retrieved))
+
+        print(f"--> Detected product: {product_category}")
+
+        if in_session and product_category == session["product_category"]:
+            matches = extend_context(
+                await self.retrieve_async(query, query_vector, product_category, FOLLOW_UP_TOP_K), session["matches"])
+            return {**self._finish_plan(query, query_vector, product_category, matches), "follow_up": True}
+
+        cached = self._cached_similar(query_vector, product_category)
+        if cached is not None:
+            return cached
+
+        if product_category in speculative:
+            matches = speculative[product_category]
+        else:
+            matches = await self.retrieve_async(query, query_vector, product_category)
+        return self._finish_plan(query, query_vector, product_category, matches)
+
+    async def get_answer_async(self, query, session_id=None):
+        """Async get_answer."""
+        plan = await self.prepare_answer_async(query, self._get_session(session_id))
+        self._remember(session_id, plan)
+        if "answer" in plan:
+            return plan["answer"]
+
+        try:
+            with span("generate"):
+                final_response = await self.gemini_model.generate_content_async(plan["prompt"])
+        except LLMUnavailable as e:
+            record_llm_error("generate", e)
+            return build_degraded_answer(plan["product_category"], plan["matches"])
+        except Exception as e:
+            record_llm_error("generate", e)
+            raise
+        record_llm_usage("generate", final_response)
+        metrics.set_answer_source("llm")
+        self._cache_answer(query, final_response.text, plan)
+        return final_response.text
+
+    async def stream_answer_async(self, query, session_id=None):
+        """Async generator version of stream_answer."""
+        plan = await self.prepare_answer_async(query, self._get_session(session_id))
+        self._remember(session_id, plan)
+        if "answer" in plan:
+            yield plan["answer"]
+            return
+
+        answer_parts = []
+        try:
+            with span("generate"):
+                response = await self.gemini_model.generate_content_async(plan["prompt"], stream=True)
+                async for chunk in response:
+                    if chunk.text:
+                        answer_parts.append(chunk.text)
+                        yield chunk.text
+        except LLMUnavailable as e:
+            record_llm_error("generate", e)
+            yield build_degraded_answer(plan["product_category"], plan["matches"])
+            return
+        except Exception as e:
+            record_llm_error("generate", e)
+            raise
+        record_llm_usage("generate", response)
+        metrics.set_answer_source("llm")
+        self._cache_answer(query, "".join(answer_parts), plan)
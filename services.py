@@ -0,0 +1,246 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+
+# Shared, lazily created models and clients for app.py, async_app.py and
+# ask_bot.py. Nothing heavy happens at import time: each getter builds its
+# object on first use (once per process) and later calls return the same one.
+
+# Load environment variables from .env file
+load_dotenv()
+
+# --- Configuration ---
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+# Pinecone hosts and namespaces come from the product registry (products.json)
+# Run one throwaway encode after loading so the first real query isn't slow
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "1") == "1"
+# A failed background warm-up is retried after this long, doubling up to the max
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+WARMUP_MAX_RETRY_SECONDS = float(os.getenv("WARMUP_MAX_RETRY_SECONDS", "300"))
+
+_lock = threading.RLock()
+_instances = {}
+_load_seconds = {}
+_warm = threading.Event()
+_warmup_status = {"attempts": 0, "last_error": None, "next_retry_seconds": None}
+_is_prefork_parent = False
+_warmup_pid = None  # process whose warm-up thread has been started
+
+
+def _get_or_create(name, factory):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            if name not in _instances:
+                start = time.perf_counter()
+                _instances[name] = factory()
+                _load_seconds[name] = round(time.perf_counter() - start, 3)
+                print(f"Loaded {name} in {_load_seconds[name]}s")
+            instance = _instances[name]
+    return instance
+
+
+def _require_env(name):
+    value = os.getenv(name)
+    if not value:
+        raise ValueError(f"{name} not found in .env file")
+    return value
+
+
+def get_index():
+    """
+    The vector index, sharded by product: Pinecone namespaces, or the local
+    embedding stores if RETRIEVER_BACKEND=local.
+    """
+    def create():
+        from local_index import LocalIndex, RETRIEVER_BACKEND
+        if RETRIEVER_BACKEND == "local":
+            return LocalIndex()
+        import pinecone
+        from pinecone_index import PineconeProductIndex
+        return PineconeProductIndex(pinecone.Pinecone(api_key=_require_env("PINECONE_API_KEY")))
+    return _get_or_create("index", create)
+
+
+def get_gemini_model():
+    """Gemini behind a GeminiClient (rate limiting, retries, request coalescing)."""
+    def create():
+        import google.generativeai as genai
+        from llm_client import GeminiClient
+        genai.configure(api_key=_require_env("GOOGLE_API_KEY"))
+        return GeminiClient(genai.GenerativeModel(GEMINI_MODEL_NAME))
+    return _get_or_create("gemini_model", create)
+
+
+def get_sentence_transformer():
+    """
+    The raw embedding model (the slow part of startup): a SentenceTransformer,
+    or its ONNX export depending on EMBEDDING_BACKEND.
+    """
+    def create():
+        from embedding_backends import load_embedding_model
+        return load_embedding_model(EMBEDDING_MODEL_NAME)
+    return _get_or_create("sentence_transformer", create)
+
+
+def get_embedding_model():
+    """
+    The SentenceTransformer behind a BatchingEmbedder, so concurrent
+    requests' queries are micro-batched into a single encode call.
+    """
+    def create():
+        from batching_embedder import BatchingEmbedder
+        return BatchingEmbedder(get_sentence_transformer())
+    return _get_or_create("embedding_model", create)
+
+
+def get_product_classifier():
+    def create():
+        from product_classifier import ProductClassifier
+        return ProductClassifier()
+    return _get_or_create("product_classifier", create)
+
+
+def get_answer_cache():
+    def create():
+        from answer_cache import AnswerCache
+        return AnswerCache()
+    return _get_or_create("answer_cache", create)
+
+
+def get_session_store():
+    def create():
+        from session_store import SessionStore
+        return SessionStore()
+    return _get_or_create("session_store", create)
+
+
+def get_faq_index():
+    """
+    The curated FAQ/issue answers for the zero-LLM fast path (built on first
+    use if needed), or None when FAQ_FAST_PATH is off.
+    """
+    def create():
+        from faq_index import FAQ_FAST_PATH, open_faq_index
+        if not FAQ_FAST_PATH:
+            return False
+        return open_faq_index(get_sentence_transformer()) or False
+    return _get_or_create("faq_index", create) or None
+
+
+def get_retriever():
+    """
+    HybridRetriever (vector + BM25, optionally reranked) when HYBRID_RETRIEVAL
+    is on, otherwise None and the pipeline does a plain vector query.
+    """
+    def create():
+        from hybrid_retrieval import HYBRID_RETRIEVAL, RERANK, HybridRetriever, KeywordIndex, CrossEncoderReranker
+        if not HYBRID_RETRIEVAL:
+            return False
+        reranker = CrossEncoderReranker() if RERANK else None
+        return HybridRetriever(get_index(), KeywordIndex(), reranker)
+    return _get_or_create("retriever", create) or None
+
+
+def get_pipeline():
+    def create():
+        from rag_pipeline import RAGPipeline
+        return RAGPipeline(get_embedding_model(), get_index(), get_gemini_model(),
+                           get_product_classifier(), get_answer_cache(), retriever=get_retriever(),
+                           session_store=get_session_store(), faq_index=get_faq_index())
+    return _get_or_create("pipeline", create)
+
+
+def get_async_pipeline():
+    def create():
+        from rag_pipeline import AsyncRAGPipeline
+        return AsyncRAGPipeline(get_embedding_model(), get_index(), get_gemini_model(),
+                                get_product_classifier(), get_answer_cache(), retriever=get_retriever(),
+                                session_store=get_session_store(), faq_index=get_faq_index())
+    return _get_or_create("async_pipeline", create)
+
+
+# --- Startup helpers ---
+
+def preload():
+    """
+    Loads the large read-only pieces (embedding model weights, classifier
+    centroids, the local index's resident shards) in the current process. Called in a prefork
+    server's parent so workers share these pages copy-on-write. Starts no
+    threads and makes no network calls, so it's safe to fork afterwards.
+    """
+    global _is_prefork_parent
+    _is_prefork_parent = True
+    get_sentence_transformer()
+    get_product_classifier()
+    from local_index import RETRIEVER_BACKEND
+    if RETRIEVER_BACKEND == "local":
+        get_index()
+
+
+def after_fork():
+    """Called in each worker after the fork; lets warm-up run in the worker."""
+    global _is_prefork_parent
+    _is_prefork_parent = False
+
+
+def warm_up():
+    """
+    Loads everything the pipeline needs and runs one throwaway encode.
+    Returns True on success; a failure is recorded for readiness().
+    """
+    _warmup_status["attempts"] += 1
+    try:
+        get_pipeline()
+        if EMBEDDING_WARMUP:
+            start = time.perf_counter()
+            get_embedding_model().encode("warm up")
+            _load_seconds["warmup_encode"] = round(time.perf_counter() - start, 3)
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        _warmup_status["last_error"] = f"{type(e).__name__}: {e}"
+        return False
+    _warmup_status["last_error"] = None
+    _warmup_status["next_retry_seconds"] = None
+    _warm.set()
+    return True
+
+
+def _warm_up_with_retries():
+    delay = WARMUP_RETRY_SECONDS
+    while not warm_up():
+        _warmup_status["next_retry_seconds"] = delay
+        print(f"Retrying warm-up in {delay:g}s")
+        time.sleep(delay)
+        delay = min(delay * 2, WARMUP_MAX_RETRY_SECONDS)
+
+
+def start_background_warmup():
+    """
+    Warms up on a daemon thread so the server can answer /ready meanwhile,
+    retrying with backoff until it succeeds. Called by the server entry
+    points (not at import); only the first call in each process starts it.
+    """
+    global _warmup_pid
+    if _is_prefork_parent:
+        # Threads don't survive fork; each worker warms up after forking instead
+        return
+    with _lock:
+        if _warmup_pid == os.getpid():
+            return
+        _warmup_pid = os.getpid()
+    threading.Thread(target=_warm_up_with_retries, name="warmup", daemon=True).start()
+
+
+def readiness():
+    """Returns (is_ready, details) for the readiness endpoint."""
+    details = {
+        "ready": _warm.is_set(),
+        "loaded": sorted(_instances),
+        "load_seconds": dict(_load_seconds),
+        "pid": os.getpid(),
+        "warmup": dict(_warmup_status),
+    }
+    return details["ready"], details
@@ -0,0 +1,120 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+# --- Configuration ---
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_MEMORY_MB = float(os.getenv("SESSION_MAX_MEMORY_MB", "64"))
+# Chunks remembered per session for follow-up questions
+SESSION_MAX_CHUNKS = 8
+# Rough per-object overheads used by the memory estimate
+SESSION_OVERHEAD_BYTES = 512
+CHUNK_OVERHEAD_BYTES = 256
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def session_id_from(value):
+    """The session id a client sent back, or a new one if it's missing or malformed."""
+    if isinstance(value, str) and 0 < len(value) <= 64 and value.isalnum():
+        return value
+    return new_session_id()
+
+
+def _session_bytes(session):
+    """Approximate memory held by one session (its strings plus fixed overheads)."""
+    size = SESSION_OVERHEAD_BYTES + len(session["product_category"] or "")
+    for match in session["matches"]:
+        size += CHUNK_OVERHEAD_BYTES + len(match["id"]) + len(match["metadata"].get("text", ""))
+    return size
+
+
+class SessionStore:
+    """
+    Server-side conversation state, keyed by session id: the product being
+    discussed and the chunks retrieved for the last answer, so follow-up
+    questions don't need the product named again. Bounded LRU with a TTL and
+    a cap on the estimated memory; the oldest sessions are evicted first.
+    """
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=SESSION_MAX_SESSIONS,
+                 max_memory_mb=SESSION_MAX_MEMORY_MB):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = int(max_memory_mb * 2 ** 20)
+        self._sessions = OrderedDict()  # session id -> session dict
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "created": 0, "evictions": 0, "expirations": 0}
+
+    def _remove(self, session_id):
+        self._bytes -= self._sessions.pop(session_id)["bytes"]
+
+    def get(self, session_id):
+        """Returns {"product_category", "matches", "turns"} for a live session, or None."""
+        if not session_id:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and now - session["updated_at"] > self.ttl_seconds:
+                self._remove(session_id)
+                self.counters["expirations"] += 1
+                session = None
+            if session is None:
+                self.counters["misses"] += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.counters["hits"] += 1
+            return {"product_category": session["product_category"], "matches": list(session["matches"]),
+                    "turns": session["turns"]}
+
+    def update(self, session_id, product_category, matches=None):
+        """
+        Records the product and (if given) the chunks used for the latest answer,
+        creating the session if needed. Keeps at most SESSION_MAX_CHUNKS chunks;
+        without new chunks, the previous ones are kept if the product is unchanged.
+        """
+        now = time.monotonic()
+        with self._lock:
+            previous = self._sessions.get(session_id)
+            if previous is not None:
+                self._remove(session_id)
+            else:
+                self.counters["created"] += 1
+            session = {
+                "product_category": product_category,
+                "matches": list(matches[:SESSION_MAX_CHUNKS]) if matches is not None
+                else (previous["matches"] if previous and previous["product_category"] == product_category
+                      else []),
+                "turns": (previous["turns"] if previous else 0) + 1,
+                "updated_at": now,
+            }
+            session["bytes"] = _session_bytes(session)
+            self._sessions[session_id] = session
+            self._bytes += session["bytes"]
+            # Least recently used first: drop expired sessions, then whatever is over the caps
+            while self._sessions:
+                oldest = next(iter(self._sessions))
+                if now - self._sessions[oldest]["updated_at"] <= self.ttl_seconds:
+                    break
+                self._remove(oldest)
+                self.counters["expirations"] += 1
+            while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._sessions)))
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        """Returns session counts, hit/miss/eviction counters and the estimated memory use."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["sessions"] = len(self._sessions)
+            stats["memory_bytes"] = self._bytes
+        stats["max_sessions"] = self.max_sessions
+        stats["max_memory_bytes"] = self.max_bytes
+        return stats
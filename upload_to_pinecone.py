@@ -1,71 +1,223 @@
 import os
-import pandas as pd
+import json
+import time
+import random
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pinecone import Pinecone
+from vector_store import open_store, store_path_for
+from product_registry import PRODUCTS, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST
 from getpass import getpass
 
-# --- 1. Initialize Connection to Pinecone ---
-print("Initializing connection to Pinecone...")
-PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY") or getpass("Enter your Pinecone API Key: ")
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
-# --- 2. Define Index Details and Connect ---
-index_name = "samsung-support-index" # A more general name is better
-index_host = "https://microwave-support-lhzdo1l.svc.aped-4627-b74a.pinecone.io" # This host is tied to the old name, that's okay
-
-print(f"Connecting to index '{index_name}' with host: {index_host}")
-index = pc.Index(host=index_host)
-print("\nConnected to index. Initial stats:")
-print(index.describe_index_stats())
-
-# --- NEW: List of all embedding files to upload ---
-files_to_upload = [
-    'microwave_embeddings.parquet',
-    'washing_machine_embeddings.parquet',
-    'fridge_embeddings.parquet'
-]
-
-# --- 3. Loop Through Each File and Upsert Data ---
-for file_path in files_to_upload:
-    print(f"\n--- Processing file: {file_path} ---")
-    
-    # 3.1. Load and Prepare Data
-    try:
-        df = pd.read_parquet(file_path)
-        # Convert dataframe to a list of dictionaries
-        records = df.to_dict('records')
-        print(f"Loaded {len(records)} records.")
-    except FileNotFoundError:
-        print(f"Error: '{file_path}' not found. Skipping.")
-        continue # Skip to the next file
-
-    # 3.2. Upsert (Upload) the Data in Batches
-    batch_size = 100
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i + batch_size]
-        
-        vectors_to_upsert = []
-        for record in batch:
-            # Create a unique ID for each vector
-            # Including product_type makes IDs even more unique
-            vector_id = f"{record['product_type']}-{record['source']}-{record['chunk_id']}"
-            
-            # Prepare the metadata, now including the crucial 'product_type'
-            metadata = {
-                "text": record['text'],
-                "source": record['source'],
-                "product_type": record['product_type'] # <-- THE KEY CHANGE!
-            }
-            
-            vectors_to_upsert.append({
-                "id": vector_id,
-                "values": record['embedding'],
-                "metadata": metadata
-            })
-        
-        # Upsert the batch to Pinecone
-        index.upsert(vectors=vectors_to_upsert)
-        print(f"Upserted batch {i//batch_size + 1} of {(len(records)-1)//batch_size + 1}")
-
-print("\n--- All files have been processed and uploaded! ---")
-print("Final index stats:")
-print(index.describe_index_stats())
\ No newline at end of file
+# --- Configuration ---
+# The index, and each product's namespace and embedding file, come from products.json
+
+# Records what has been uploaded ({shard key: {vector id: content hash}}) for --sync
+MANIFEST_PATH = "pinecone_manifest.json"
+BATCH_SIZE = 100
+UPLOAD_WORKERS = 4
+MAX_RETRIES = 5
+
+
+def vector_id_for(product_type, source, chunk_id):
+    # Including product_type makes IDs even more unique
+    return f"{product_type}-{source}-{chunk_id}"
+
+
+def load_records(file_path):
+    """
+    Opens the vector store for an embeddings file and returns
+    {vector_id: (content_hash, row number)} and the store. Vectors stay in the
+    memory-mapped block and are only read for rows that actually need uploading.
+    """
+    store = open_store(file_path)
+    df = store.metadata
+    if "content_hash" in df.columns:
+        hashes = df["content_hash"]
+    else:
+        # Files from before incremental embedding: hash the text instead
+        hashes = [hashlib.sha256(t.encode("utf-8")).hexdigest() for t in df["text"]]
+    ids = [vector_id_for(p, s, c) for p, s, c in zip(df["product_type"], df["source"], df["chunk_id"])]
+    return dict(zip(ids, zip(hashes, range(len(df))))), store
+
+
+def to_vector(vector_id, store, row_number):
+    row = store.metadata.iloc[row_number]
+    return {
+        "id": vector_id,
+        "values": store.dense(row_number, row_number + 1)[0].tolist(),
+        # Prepare the metadata, now including the crucial 'product_type'
+        "metadata": {
+            "text": row["text"],
+            "source": row["source"],
+            "product_type": row["product_type"] # <-- THE KEY CHANGE!
+        }
+    }
+
+
+def with_retries(operation, description):
+    """Runs operation(), retrying with exponential backoff and jitter on failure."""
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            return operation()
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = min(30, 2 ** attempt) * (0.5 + random.random())
+            print(f"{description} failed ({e}); retry {attempt}/{MAX_RETRIES - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def shard_key(product):
+    """Manifest key for a product's shard: its file, plus the namespace if it has one."""
+    if product["namespace"]:
+        return f"{product['namespace']}:{product['embedding_file']}"
+    return product["embedding_file"]
+
+
+def indexed_ids(index, product_name, namespace=None):
+    """
+    Ids of a product's vectors currently in `namespace` (default: the shared
+    one), e.g. from uploads the manifest doesn't know about. Every id starts
+    with the product name (see vector_id_for).
+    """
+    scope = {"namespace": namespace} if namespace else {}
+    return [vid for page in index.list(prefix=f"{product_name}-", **scope) for vid in page]
+
+
+def run_batches(index, upserts, deletes, workers, namespace=None):
+    """
+    Upserts and deletes in batches of BATCH_SIZE on a bounded thread pool, in
+    `namespace` (or the default one). Returns the set of vector ids whose batch
+    failed after all retries.
+    """
+    scope = {"namespace": namespace} if namespace else {}
+    jobs = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(0, len(upserts), BATCH_SIZE):
+            batch = upserts[i:i + BATCH_SIZE]
+            job = pool.submit(with_retries, lambda b=batch: index.upsert(vectors=b, **scope),
+                              f"Upsert batch {i // BATCH_SIZE + 1}")
+            jobs[job] = [v["id"] for v in batch]
+        for i in range(0, len(deletes), BATCH_SIZE):
+            batch = deletes[i:i + BATCH_SIZE]
+            job = pool.submit(with_retries, lambda b=batch: index.delete(ids=b, **scope),
+                              f"Delete batch {i // BATCH_SIZE + 1}")
+            jobs[job] = batch
+
+        failed = set()
+        for done, job in enumerate(as_completed(jobs), start=1):
+            if job.exception() is not None:
+                print(f"Error: batch gave up after {MAX_RETRIES} attempts: {job.exception()}")
+                failed.update(jobs[job])
+            print(f"Finished batch {done} of {len(jobs)}")
+    return failed
+
+
+def upload_file(index, file_path, uploaded, sync, workers, namespace=None, known_ids=()):
+    """
+    Uploads one product's embeddings into its namespace. With sync=True only
+    vectors whose content hash differs from `uploaded` (this shard's manifest
+    entries) are upserted, and ids in it or in `known_ids` (already in the
+    index) that no longer exist locally are deleted. Updates `uploaded` in place.
+    """
+    records, store = load_records(file_path)
+    print(f"Loaded {len(records)} records.")
+
+    if sync:
+        changed = [vid for vid, (h, _) in records.items() if uploaded.get(vid) != h]
+        orphaned = sorted({vid for vid in [*uploaded, *known_ids] if vid not in records})
+    else:
+        changed, orphaned = list(records), []
+    print(f"{len(changed)} vectors to upsert, {len(orphaned)} orphaned vectors to delete.")
+
+    upserts = [to_vector(vid, store, records[vid][1]) for vid in changed]
+    failed = run_batches(index, upserts, orphaned, workers, namespace)
+
+    for vid in changed:
+        if vid not in failed:
+            uploaded[vid] = records[vid][0]
+    for vid in orphaned:
+        if vid not in failed:
+            uploaded.pop(vid, None)
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload the embedding stores to Pinecone.")
+    parser.add_argument("--sync", action="store_true",
+                        help="Only upload changed vectors and delete orphaned ones, based on the manifest.")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS, help="Concurrent batch requests.")
+    args = parser.parse_args()
+
+    # --- 1. Initialize Connection to Pinecone ---
+    print("Initializing connection to Pinecone...")
+    PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY") or getpass("Enter your Pinecone API Key: ")
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+
+    # --- 2. Connect to the Index (and any product with its own index_host) ---
+    print(f"Connecting to index '{PINECONE_INDEX_NAME}' with host: {PINECONE_INDEX_HOST}")
+    indexes = {host: pc.Index(host=host)
+               for host in {product["index_host"] or PINECONE_INDEX_HOST for product in PRODUCTS.values()}}
+    print("\nConnected to index. Initial stats:")
+    for index in indexes.values():
+        print(index.describe_index_stats())
+
+    manifest = {}
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    elif args.sync:
+        print(f"No '{MANIFEST_PATH}' yet; the first sync uploads everything.")
+
+    # --- 3. Loop Through Each Product and Upload to its Shard ---
+    for name, product in PRODUCTS.items():
+        file_path = product["embedding_file"]
+        index = indexes[product["index_host"] or PINECONE_INDEX_HOST]
+        print(f"\n--- Processing {name}: {file_path} -> namespace '{product['namespace'] or ''}' ---")
+        if not os.path.exists(file_path) and not os.path.exists(store_path_for(file_path)):
+            print(f"Error: '{file_path}' not found. Skipping.")
+            continue
+        known_ids = []
+        if args.sync and not manifest.get(shard_key(product)):
+            # Nothing recorded for this shard (first sync): ask the index what's there,
+            # so vectors from earlier uploads whose chunks no longer exist are deleted
+            try:
+                known_ids = indexed_ids(index, name, product["namespace"])
+                print(f"No manifest entries for this shard; {len(known_ids)} vectors found in the index.")
+            except Exception as e:
+                print(f"Warning: could not list the index ({e}); orphaned vectors from earlier uploads are kept.")
+        upload_file(index, file_path, manifest.setdefault(shard_key(product), {}), sync=args.sync,
+                    workers=args.workers, namespace=product["namespace"], known_ids=known_ids)
+
+        # Moved to a namespace: with --sync, delete its old copies from the shared
+        # namespace, both the ones in the manifest and any uploaded without one
+        if product["namespace"] and args.sync:
+            # The shared namespace is in the main index, even for a product with its own index_host
+            shared_index = indexes.get(PINECONE_INDEX_HOST) or pc.Index(host=PINECONE_INDEX_HOST)
+            legacy = manifest.get(file_path, {})
+            try:
+                stale = set(legacy) | set(indexed_ids(shared_index, name))
+            except Exception as e:
+                # Indexes that can't list ids (pod-based) can delete by metadata instead
+                print(f"Could not list the shared namespace ({e}); deleting by product_type filter.")
+                with_retries(lambda: shared_index.delete(filter={"product_type": name}),
+                             f"Deleting {name} from the shared namespace")
+                stale = set()
+                legacy = {}
+            if stale:
+                print(f"Deleting {len(stale)} vectors from the shared namespace...")
+            failed = run_batches(shared_index, [], sorted(stale), args.workers)
+            manifest[file_path] = {vid: h for vid, h in legacy.items() if vid in failed}
+            if not manifest[file_path]:
+                del manifest[file_path]
+
+        # Save after every file so an interrupted run keeps its progress
+        with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    print("\n--- All files have been processed and uploaded! ---")
+    print("Final index stats:")
+    for index in indexes.values():
+        print(index.describe_index_stats())
@@ -0,0 +1,213 @@
+import os
+import json
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock; see store_lock
+    fcntl = None
+
+# Compact on-disk format for a product's chunk embeddings, replacing the
+# parquet file with one Python list of floats per row:
+#
+#   <product>_embeddings/
+#       vectors.npy       contiguous (rows, dim) block: float32, float16 or int8
+#       scales.npy        per-row float32 scales (int8 only)
+#       metadata.parquet  source, chunk_id, text, product_type, content_hash
+#       store.json        dtype, shape and format version
+#   <product>_embeddings.lock   taken while a store is built, replaced or opened
+#
+# Vectors are stored L2-normalized (we only ever use cosine similarity), and
+# vectors.npy is memory-mapped on load, so a float32 store is used in place
+# without copying it into the Python heap.
+
+# --- Configuration ---
+# float32 is exact; float16 halves the size; int8 quarters it (about 1e-3 cosine error)
+STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32")
+STORE_DTYPES = ("float32", "float16", "int8")
+STORE_FORMAT_VERSION = 1
+METADATA_COLUMNS = ["source", "chunk_id", "text", "product_type", "content_hash"]
+# Rows dequantized at a time when scoring float16/int8 stores
+SCORE_BLOCK_ROWS = 8192
+
+
+def store_path_for(file_path):
+    """The store directory that replaces a '<product>_embeddings.parquet' file."""
+    return os.path.splitext(file_path)[0]
+
+
+_held_locks = threading.local()
+_warned_no_lock = False
+
+
+@contextmanager
+def store_lock(path):
+    """
+    Exclusive lock on the store at `path`, shared across processes (each
+    server worker may build or convert the same store at startup).
+    Re-entrant within a thread. A no-op where fcntl doesn't exist (Windows).
+    """
+    global _warned_no_lock
+    key = os.path.abspath(path)
+    held = _held_locks.__dict__.setdefault("paths", set())
+    if key in held:
+        yield
+        return
+    if fcntl is None:
+        if not _warned_no_lock:
+            _warned_no_lock = True
+            print("Warning: file locks aren't available on this platform; run a single server "
+                  "process (or build the stores first) so they aren't built concurrently.")
+        yield
+        return
+    with open(f"{key}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def normalize_rows(vectors):
+    """Scales each row of a 2D array to unit length (zero rows are left as-is)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def write_store(path, vectors, metadata, dtype=STORE_DTYPE, columns=METADATA_COLUMNS):
+    """
+    Writes normalized vectors (rows aligned with the metadata DataFrame) as a
+    store at `path`, replacing any previous one once the new one is complete.
+    Only the given metadata columns are kept.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unknown store dtype '{dtype}' (use {', '.join(STORE_DTYPES)})")
+    vectors = normalize_rows(np.asarray(vectors).reshape(len(metadata), -1))
+
+    temp_path = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        np.save(os.path.join(temp_path, "scales.npy"), scales.astype(np.float32))
+        stored = np.round(vectors / scales[:, None]).astype(np.int8)
+    else:
+        stored = vectors.astype(dtype)
+    np.save(os.path.join(temp_path, "vectors.npy"), np.ascontiguousarray(stored))
+
+    columns = [column for column in columns if column in metadata.columns]
+    metadata[columns].reset_index(drop=True).to_parquet(os.path.join(temp_path, "metadata.parquet"))
+    with open(os.path.join(temp_path, "store.json"), "w", encoding="utf-8") as f:
+        json.dump({"format_version": STORE_FORMAT_VERSION, "dtype": dtype,
+                   "rows": int(stored.shape[0]), "dimension": int(stored.shape[1])}, f, indent=2)
+
+    # A directory can't be replaced by rename while it has files in it, so
+    # the old store is moved aside first; under the lock, readers that go
+    # through open_store never see the gap in between.
+    old_path = f"{path}.old{os.getpid()}"
+    with store_lock(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(temp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class VectorStore:
+    """
+    A loaded store: `vectors` is a read-only view of vectors.npy (memory-mapped
+    unless use_mmap=False) and `metadata` the chunk table, in the same row order.
+    """
+
+    def __init__(self, path, use_mmap=True):
+        self.path = path
+        with open(os.path.join(path, "store.json"), "r", encoding="utf-8") as f:
+            self.info = json.load(f)
+        mmap_mode = "r" if use_mmap else None
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+        self.scales = (np.load(os.path.join(path, "scales.npy"), mmap_mode=mmap_mode)
+                       if self.dtype == "int8" else None)
+        self.metadata = pd.read_parquet(os.path.join(path, "metadata.parquet"))
+
+    @property
+    def dtype(self):
+        return self.info["dtype"]
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def dense(self, start=0, stop=None):
+        """
+        Rows [start, stop) as float32. Zero-copy for float32 stores; float16 and
+        int8 rows are dequantized into a new array.
+        """
+        block = self.vectors[start:stop]
+        if self.dtype == "float32":
+            return block
+        block = block.astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def scores(self, queries):
+        """
+        Cosine similarity of normalized float32 queries to every row: shape
+        (rows,) for one query vector, (queries, rows) for a 2D batch.
+        """
+        if self.dtype == "float32":
+            return (self.vectors @ queries.T).T
+        blocks = [(self.dense(start, start + SCORE_BLOCK_ROWS) @ queries.T).T
+                  for start in range(0, len(self), SCORE_BLOCK_ROWS)]
+        return np.concatenate(blocks, axis=-1) if blocks else np.empty(queries.shape[:-1] + (0,), np.float32)
+
+
+def convert_parquet(file_path, dtype=STORE_DTYPE):
+    """Converts an old list-of-floats embeddings parquet file into a store next to it."""
+    df = pd.read_parquet(file_path)
+    vectors = np.vstack(df["embedding"].to_numpy()).astype(np.float32)
+    path = store_path_for(file_path)
+    write_store(path, vectors, df.drop(columns=["embedding"]), dtype)
+    return path
+
+
+def open_store(file_path, use_mmap=True):
+    """
+    Opens the store for an embeddings file path ('<product>_embeddings.parquet').
+    The store is the source of truth: an old-format parquet file is only
+    converted when there is no store yet (by one process at a time), never
+    over an existing one, since file mtimes after a checkout say nothing about
+    which is newer. Run `python vector_store.py` to reconvert explicitly.
+    Returns None when neither exists.
+    """
+    path = store_path_for(file_path)
+    with store_lock(path):
+        # Checked under the lock: another process may have just converted it
+        if not os.path.exists(os.path.join(path, "store.json")):
+            if not os.path.exists(file_path):
+                return None
+            print(f"Converting '{file_path}' to a {STORE_DTYPE} vector store in '{path}/'...")
+            convert_parquet(file_path)
+        return VectorStore(path, use_mmap=use_mmap)
+
+
+# --- SCRIPT EXECUTION ---
+if __name__ == "__main__":
+    import argparse
+    from product_classifier import EMBEDDING_FILES
+
+    parser = argparse.ArgumentParser(description="Convert embedding parquet files to vector stores.")
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default=STORE_DTYPE)
+    args = parser.parse_args()
+
+    for file_path in EMBEDDING_FILES.values():
+        if os.path.exists(file_path):
+            print(f"Converting '{file_path}' -> '{convert_parquet(file_path, args.dtype)}/' ({args.dtype})")